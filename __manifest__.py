@@ -1,7 +1,7 @@
 #  © opyright 2024 Lasse Larsson, Kubang AB
 {
     'name': 'Supplier Information Import',
-    'version': '16.0.3.1.0',
+    'version': '16.0.3.5.0',
     'category': 'Inventory',
     'summary': 'Import and manage incoming product information',
     'description': """
@@ -13,10 +13,14 @@ This module allows importing product information from various suppliers and mana
     'data': [
         'security/ir.model.access.csv',
         'data/email_templates.xml',
+        'data/ir_cron.xml',
         'wizards/product_operations_views.xml',
         'views/import_config_views.xml',
         'views/file_analysis_wizard_view.xml',
         'views/incoming_product_info_views.xml',
+        'views/import_product_job_views.xml',
+        'views/import_run_views.xml',
+        'views/product_info_report_export_views.xml',
         'views/product_views.xml',
         'views/stock_picking_views.xml',
         'views/sale_order_views.xml',
@@ -0,0 +1,93 @@
+import csv
+import datetime
+import io
+import json
+import logging
+
+import odoo
+from odoo import http, api, models
+from odoo.http import request, content_disposition
+from werkzeug.exceptions import NotFound
+
+_logger = logging.getLogger(__name__)
+
+REPORT_MODELS = ('sale.order', 'stock.picking')
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+# Rows encoded together in one chunk of the response
+ROWS_PER_CHUNK = 200
+
+
+class ProductInfoReportController(http.Controller):
+
+    @http.route('/supplier_information_import/report/<string:res_model>/<int:res_id>.<string:file_format>',
+                type='http', auth='user', methods=['GET'])
+    def stream_report(self, res_model, res_id, file_format, **kwargs):
+        """
+        Stream the product info report of a sales order or transfer as CSV or
+        NDJSON, with the columns of the report field configuration. Rows are
+        sent in chunks while the later ones are still being computed.
+        """
+        if res_model not in REPORT_MODELS or file_format not in CONTENT_TYPES:
+            raise NotFound()
+        record = request.env[res_model].browse(res_id).exists()
+        if not record:
+            raise NotFound()
+        record.check_access_rights('read')
+        record.check_access_rule('read')
+
+        file_name = f'Product_Info_{record.name}.{file_format}'.replace('/', '-')
+        headers = [
+            ('Content-Type', CONTENT_TYPES[file_format]),
+            ('Content-Disposition', content_disposition(file_name)),
+            ('X-Content-Type-Options', 'nosniff'),
+        ]
+        stream = self._stream_report_rows(
+            request.db, request.env.uid, dict(request.env.context), res_model, res_id, file_format)
+        return request.make_response(stream, headers)
+
+    def _stream_report_rows(self, dbname, uid, context, res_model, res_id, file_format):
+        """
+        Generate the encoded chunks of the report. The response is sent after
+        the request cursor is closed, so the rows are read with a cursor of
+        their own.
+        """
+        registry = odoo.registry(dbname)
+        with registry.cursor() as cr:
+            env = api.Environment(cr, uid, context)
+            record = env[res_model].browse(res_id)
+            if file_format == 'csv':
+                yield self._encode_csv([record._get_report_headers(lang=record._get_partner_lang())])
+            keys = record._get_report_column_keys()
+
+            rows = []
+            row_count = 0
+            for row in record._iter_report_rows():
+                rows.append([self._format_value(value) for value in row])
+                if len(rows) >= ROWS_PER_CHUNK:
+                    yield self._encode_rows(rows, keys, file_format)
+                    row_count += len(rows)
+                    rows = []
+            if rows:
+                yield self._encode_rows(rows, keys, file_format)
+                row_count += len(rows)
+            _logger.info(f"Streamed {row_count} product info report rows of {res_model} {res_id} as {file_format}")
+
+    def _encode_rows(self, rows, keys, file_format):
+        if file_format == 'csv':
+            return self._encode_csv(rows)
+        return ''.join(json.dumps(dict(zip(keys, row)), ensure_ascii=False) + '\n' for row in rows).encode()
+
+    def _encode_csv(self, rows):
+        output = io.StringIO()
+        csv.writer(output).writerows(rows)
+        return output.getvalue().encode()
+
+    def _format_value(self, value):
+        if isinstance(value, models.BaseModel):
+            return value.display_name or ''
+        if isinstance(value, (datetime.date, datetime.datetime)):
+            return value.isoformat()
+        return value
@@ -0,0 +1,34 @@
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    """
+    Remove duplicate incoming product info records before the unique
+    (supplier_id, sn) constraint is added. Per supplier and serial number
+    the record that went furthest is kept: a received one first, then one
+    linked to a lot, then one linked to a picking, and the most recent one
+    among equals, matching the last-write-wins behaviour of the import.
+    """
+    cr.execute("""
+        SELECT id, supplier_id, sn, state, lot_id, stock_picking_id, survivor_id FROM (
+            SELECT id, supplier_id, sn, state, lot_id, stock_picking_id,
+                   first_value(id) OVER (
+                       PARTITION BY supplier_id, sn
+                       ORDER BY state = 'received' DESC, lot_id IS NOT NULL DESC,
+                                stock_picking_id IS NOT NULL DESC, id DESC
+                   ) AS survivor_id
+              FROM incoming_product_info
+        ) ranked
+         WHERE id != survivor_id
+    """)
+    removed = cr.fetchall()
+    if not removed:
+        return
+    for record_id, supplier_id, sn, state, lot_id, picking_id, survivor_id in removed:
+        _logger.info(f"Removing duplicate incoming product info {record_id} (supplier {supplier_id}, "
+                     f"serial number {sn}, state {state}, lot {lot_id}, picking {picking_id}), "
+                     f"keeping {survivor_id}")
+    cr.execute("DELETE FROM incoming_product_info WHERE id IN %s", [tuple(row[0] for row in removed)])
+    _logger.info(f"Removed {cr.rowcount} duplicate incoming product info records")
@@ -0,0 +1,35 @@
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    """
+    Move the serial numbers combination rules were applied to from the
+    applied_serial_numbers JSON column to the import_combination_rule_hit
+    table, then drop the old columns. The count is now derived from the
+    table.
+    """
+    cr.execute("""
+        SELECT 1 FROM information_schema.columns
+         WHERE table_name = 'import_combination_rule' AND column_name = 'applied_serial_numbers'
+    """)
+    if not cr.fetchone():
+        return
+
+    cr.execute("""
+        INSERT INTO import_combination_rule_hit (rule_id, sn)
+        SELECT rule.id, applied.sn
+          FROM import_combination_rule rule,
+               jsonb_object_keys(rule.applied_serial_numbers::jsonb) AS applied(sn)
+         WHERE rule.applied_serial_numbers IS NOT NULL
+           AND rule.applied_serial_numbers NOT IN ('', '{}')
+        ON CONFLICT (rule_id, sn) DO NOTHING
+    """)
+    _logger.info(f"Moved {cr.rowcount} combination rule hits to import_combination_rule_hit")
+
+    cr.execute("""
+        ALTER TABLE import_combination_rule
+        DROP COLUMN applied_serial_numbers,
+        DROP COLUMN IF EXISTS count
+    """)
@@ -0,0 +1,50 @@
+import json
+import logging
+
+from psycopg2.extras import execute_values
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    """
+    Move the unmatched rows kept in the raw_data JSON of unmatched model
+    numbers to the unmatched_model_no_line table, then drop raw_data. The
+    count of a model number becomes the number of its rows.
+    """
+    cr.execute("""
+        SELECT 1 FROM information_schema.columns
+         WHERE table_name = 'unmatched_model_no' AND column_name = 'raw_data'
+    """)
+    if not cr.fetchone():
+        return
+
+    cr.execute("SELECT id, raw_data FROM unmatched_model_no WHERE raw_data IS NOT NULL AND raw_data != ''")
+    lines = []
+    for unmatched_id, raw_data in cr.fetchall():
+        try:
+            rows = json.loads(raw_data)
+        except ValueError:
+            # Written as a plain string by an old version, nothing to recover
+            continue
+        if not isinstance(rows, dict):
+            continue
+        for row_key, values in rows.items():
+            sn = values.get('sn') if isinstance(values, dict) else None
+            lines.append((unmatched_id, row_key, sn, json.dumps(values)))
+
+    if lines:
+        execute_values(cr, """
+            INSERT INTO unmatched_model_no_line (unmatched_id, row_key, sn, data) VALUES %s
+            ON CONFLICT (unmatched_id, row_key) DO NOTHING
+        """, lines, page_size=1000)
+        cr.execute("""
+            UPDATE unmatched_model_no unmatched
+               SET count = line.count
+              FROM (SELECT unmatched_id, count(*) AS count
+                      FROM unmatched_model_no_line GROUP BY unmatched_id) AS line
+             WHERE unmatched.id = line.unmatched_id
+        """)
+    _logger.info(f"Moved {len(lines)} unmatched rows to unmatched_model_no_line")
+
+    cr.execute("ALTER TABLE unmatched_model_no DROP COLUMN raw_data")
@@ -0,0 +1,99 @@
+import json
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def _merge_raw_data(raw_datas):
+    """
+    Merge the raw_data of unmatched model numbers: the JSON row dicts
+    written since 16.0.3.1.0 are merged, the first record keeping its rows,
+    anything else is appended line by line as the old versions did.
+    """
+    rows = {}
+    texts = []
+    for raw_data in raw_datas:
+        if not raw_data:
+            continue
+        try:
+            data = json.loads(raw_data)
+        except ValueError:
+            data = None
+        if isinstance(data, dict):
+            for row_key, values in data.items():
+                rows.setdefault(row_key, values)
+        else:
+            texts.append(raw_data)
+    if texts:
+        return "\n".join(texts + ([json.dumps(rows)] if rows else [])), None
+    return json.dumps(rows), len(rows)
+
+
+def migrate(cr, version):
+    """
+    Merge the unmatched model numbers created twice for the same
+    configuration and case-insensitive model number before the unique
+    (config_id, model_no_lower) constraint is added. The record with a
+    product, or else the oldest one, keeps the rows of the others.
+
+    Databases coming from before 16.0.3.4.0 still keep the rows in the
+    raw_data column, which is merged here and moved to the line table by the
+    16.0.3.4.0 post-migration. Newer databases have their line rows moved
+    to the surviving record.
+    """
+    cr.execute("""
+        SELECT id, first_value(id) OVER (
+                   PARTITION BY config_id, model_no_lower
+                   ORDER BY product_id IS NULL, id
+               ) AS survivor_id
+          FROM unmatched_model_no
+    """)
+    merged_ids = {}
+    for record_id, survivor_id in cr.fetchall():
+        if record_id != survivor_id:
+            merged_ids.setdefault(survivor_id, []).append(record_id)
+    if not merged_ids:
+        return
+
+    cr.execute("""
+        SELECT column_name FROM information_schema.columns
+         WHERE table_name = 'unmatched_model_no' AND column_name = 'raw_data'
+    """)
+    has_raw_data = bool(cr.fetchone())
+    cr.execute("SELECT to_regclass('unmatched_model_no_line') IS NOT NULL")
+    has_lines = cr.fetchone()[0]
+
+    for survivor_id, duplicate_ids in merged_ids.items():
+        ids = [survivor_id] + duplicate_ids
+        if has_raw_data:
+            cr.execute("""
+                SELECT raw_data, count FROM unmatched_model_no
+                 WHERE id = ANY(%s) ORDER BY array_position(%s, id)
+            """, [ids, ids])
+            rows = cr.fetchall()
+            raw_data, row_count = _merge_raw_data([raw_data for raw_data, count in rows])
+            if row_count is None:
+                row_count = sum(count or 0 for raw_data, count in rows)
+            cr.execute("UPDATE unmatched_model_no SET raw_data = %s, count = %s WHERE id = %s",
+                       [raw_data, row_count, survivor_id])
+        if has_lines:
+            # One duplicate at a time, rows already on the survivor stay
+            # with the duplicate and are deleted with it
+            for duplicate_id in duplicate_ids:
+                cr.execute("""
+                    UPDATE unmatched_model_no_line line
+                       SET unmatched_id = %s
+                     WHERE line.unmatched_id = %s
+                       AND NOT EXISTS (SELECT 1 FROM unmatched_model_no_line other
+                                        WHERE other.unmatched_id = %s AND other.row_key = line.row_key)
+                """, [survivor_id, duplicate_id, survivor_id])
+            cr.execute("""
+                UPDATE unmatched_model_no
+                   SET count = (SELECT count(*) FROM unmatched_model_no_line WHERE unmatched_id = %s)
+                 WHERE id = %s
+            """, [survivor_id, survivor_id])
+        _logger.info(f"Merging unmatched model numbers {duplicate_ids} into {survivor_id}")
+
+    duplicate_ids = [record_id for ids in merged_ids.values() for record_id in ids]
+    cr.execute("DELETE FROM unmatched_model_no WHERE id = ANY(%s)", [duplicate_ids])
+    _logger.info(f"Merged {cr.rowcount} duplicate unmatched model numbers")
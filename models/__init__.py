@@ -6,5 +6,9 @@ from . import incoming_product_info
 from . import import_format_config
 from . import stock_picking
 from . import unmatched_model_no
+from . import import_product_job
+from . import import_run
+from . import ir_attachment
+from . import product_info_report_export
 from . import sale_order
 from . import report_field_config
\ No newline at end of file
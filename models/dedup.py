@@ -0,0 +1,86 @@
+import logging
+import os
+import sqlite3
+import tempfile
+
+_logger = logging.getLogger(__name__)
+
+# Serial numbers kept in memory before the set moves to a file on disk
+MEMORY_LIMIT = 1000000
+SQLITE_BATCH_SIZE = 500
+
+
+class SeenSerialNumbers:
+    """
+    The serial numbers seen so far in an import file, with the row number
+    they were first seen on. Kept in a dict until it holds memory_limit
+    serial numbers, then moved to a temporary SQLite database so very large
+    files don't exhaust the memory.
+
+    Lookups are done per chunk, and a row is only a duplicate of rows before
+    it, so checking a chunk again after a retry gives the same result.
+    """
+
+    def __init__(self, memory_limit=MEMORY_LIMIT):
+        self.memory_limit = memory_limit
+        self._memory = {}
+        self._db = None
+        self._path = None
+
+    def check_chunk(self, rows):
+        """
+        Record the serial numbers of a chunk of rows and find the duplicates.
+
+        :param rows: A list of (row number, serial number) tuples, in file order
+        :return: A dict mapping the row number of every row whose serial number
+                 was seen on an earlier row to the row it was first seen on
+        """
+        first_rows = self._lookup({sn for index, sn in rows})
+        duplicates = {}
+        new_rows = {}
+        for index, sn in rows:
+            first_row = first_rows.get(sn)
+            if first_row is None or first_row > index:
+                first_rows[sn] = index
+                new_rows[sn] = index
+            elif first_row < index:
+                duplicates[index] = first_row
+        self._store(new_rows)
+        return duplicates
+
+    def _lookup(self, sns):
+        if self._db is None:
+            return {sn: self._memory[sn] for sn in sns if sn in self._memory}
+        found = {}
+        sns = list(sns)
+        for start in range(0, len(sns), SQLITE_BATCH_SIZE):
+            batch = sns[start:start + SQLITE_BATCH_SIZE]
+            found.update(self._db.execute(
+                f"SELECT sn, row FROM seen WHERE sn IN ({','.join('?' * len(batch))})", batch))
+        return found
+
+    def _store(self, rows):
+        if self._db is None:
+            self._memory.update(rows)
+            if len(self._memory) > self.memory_limit:
+                self._spill()
+        elif rows:
+            self._db.executemany("INSERT OR REPLACE INTO seen (sn, row) VALUES (?, ?)", rows.items())
+
+    def _spill(self):
+        fd, self._path = tempfile.mkstemp(prefix='import_sn_', suffix='.sqlite')
+        os.close(fd)
+        _logger.info(f"Moving {len(self._memory)} seen serial numbers to {self._path}")
+        self._db = sqlite3.connect(self._path)
+        self._db.execute("PRAGMA journal_mode = OFF")
+        self._db.execute("PRAGMA synchronous = OFF")
+        self._db.execute("CREATE TABLE seen (sn TEXT PRIMARY KEY, row INTEGER NOT NULL)")
+        self._db.executemany("INSERT INTO seen (sn, row) VALUES (?, ?)", self._memory.items())
+        self._memory = {}
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+            os.unlink(self._path)
+        self._memory = {}
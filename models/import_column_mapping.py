@@ -65,7 +65,9 @@ class ImportColumnMapping(models.Model):
         for vals in vals_list:
             if not vals.get('custom_label'):
                 vals['custom_label'] = vals.get('source_column') or vals.get('custom_field_name') or _('Unnamed Column')
-        return super(ImportColumnMapping, self).create(vals_list)
+        records = super(ImportColumnMapping, self).create(vals_list)
+        records.config_id._bump_mapping_version()
+        return records
 
     def write(self, vals):
         if vals.get('destination_field_name') == 'custom':
@@ -74,7 +76,17 @@ class ImportColumnMapping(models.Model):
             vals['custom_field_name'] = False
         if 'destination_field_name' in vals and 'custom_label' not in vals:
             vals['custom_label'] = self.source_column or vals.get('custom_field_name', 'Unknown')
-        return super(ImportColumnMapping, self).write(vals)
+        configs = self.config_id
+        res = super(ImportColumnMapping, self).write(vals)
+        if {'config_id', 'source_column', 'destination_field_name'} & set(vals):
+            (configs | self.config_id)._bump_mapping_version()
+        return res
+
+    def unlink(self):
+        configs = self.config_id
+        res = super(ImportColumnMapping, self).unlink()
+        configs.exists()._bump_mapping_version()
+        return res
 
     def _get_default_custom_label(self):
         self.ensure_one()
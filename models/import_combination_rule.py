@@ -1,6 +1,5 @@
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
-import json
 
 
 class ImportCombinationRule(models.Model):
@@ -18,11 +17,18 @@ class ImportCombinationRule(models.Model):
     value_2 = fields.Char(string='Value 2', required=True)
     combination_pattern = fields.Char(string='Combination Pattern', required=True, default="{0}-{1}")
     regex_pattern = fields.Char(string='Regex Pattern')
-    count = fields.Integer(string='Count', default=0)
-    applied_serial_numbers = fields.Text(string='Applied Serial Numbers')
+    count = fields.Integer(string='Count', compute='_compute_count')
+    hit_ids = fields.One2many('import.combination.rule.hit', 'rule_id', string='Applied Serial Numbers')
     product_id = fields.Many2one('product.product', string='Product Variant')
 
 
+    def _compute_count(self):
+        groups = self.env['import.combination.rule.hit'].read_group(
+            [('rule_id', 'in', self.ids)], ['rule_id'], ['rule_id'])
+        counts = {group['rule_id'][0]: group['rule_id_count'] for group in groups}
+        for rule in self:
+            rule.count = counts.get(rule.id, 0)
+
     @api.constrains('field_1', 'field_2')
     def _check_fields(self):
         for rule in self:
@@ -46,15 +52,28 @@ class ImportCombinationRule(models.Model):
 
     @api.model
     def update_rule_count(self, rule_id, serial_number):
-        rule = self.browse(rule_id)
-        applied_sns = json.loads(rule.applied_serial_numbers or '{}')
-        
-        if serial_number not in applied_sns:
-            applied_sns[serial_number] = True
-            rule.write({
-                'count': len(applied_sns),
-                'applied_serial_numbers': json.dumps(applied_sns)
-            })
+        self._record_hits([(rule_id, serial_number)])
+
+    @api.model
+    def _record_hits(self, hits):
+        """
+        Store the serial numbers a set of rules were applied to, with one
+        INSERT. Serial numbers a rule was already applied to are ignored.
+
+        :param hits: An iterable of (rule_id, serial_number) tuples
+        """
+        # Sorted, so concurrent imports take the index locks in the same order
+        hits = sorted({(rule_id, sn) for rule_id, sn in hits if rule_id and sn})
+        if not hits:
+            return
+        rule_ids, sns = zip(*hits)
+        self.env.cr.execute("""
+            INSERT INTO import_combination_rule_hit (rule_id, sn)
+            SELECT rule_id, sn FROM unnest(%s::int[], %s::varchar[]) AS hit(rule_id, sn)
+            ON CONFLICT (rule_id, sn) DO NOTHING
+        """, (list(rule_ids), list(sns)))
+        self.env['import.combination.rule.hit'].invalidate_model()
+        self.browse(set(rule_ids)).invalidate_recordset(['count', 'hit_ids'])
     
     @api.model_create_multi
     def create(self, vals_list):
@@ -66,4 +85,17 @@ class ImportCombinationRule(models.Model):
     def write(self, vals):
         if 'value_1' in vals or 'value_2' in vals:
             vals['name'] = f"{vals.get('value_1', self.value_1)} - {vals.get('value_2', self.value_2)}"
-        return super(ImportCombinationRule, self).write(vals)
\ No newline at end of file
+        return super(ImportCombinationRule, self).write(vals)
+
+
+class ImportCombinationRuleHit(models.Model):
+    _name = 'import.combination.rule.hit'
+    _description = 'Import Combination Rule Hit'
+    _log_access = False
+
+    rule_id = fields.Many2one('import.combination.rule', string='Rule', required=True, ondelete='cascade')
+    sn = fields.Char(string='Serial Number', required=True)
+
+    _sql_constraints = [
+        ('rule_sn_uniq', 'unique(rule_id, sn)', 'A rule is only counted once per serial number.'),
+    ]
@@ -0,0 +1,65 @@
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class ImportContext:
+    """
+    Lookups that stay the same for the whole import of one configuration.
+
+    The compiled column mapping plan and combination rules, the supplier
+    hierarchy, its supplier infos and the supplier code to product mapping
+    are computed once when the context is created, and the products resolved
+    for a product key are kept for the rest of the import.
+    """
+
+    def __init__(self, env, config):
+        self.config = config
+        IncomingProductInfo = env['incoming.product.info']
+
+        self.supplier_and_contacts = IncomingProductInfo._get_supplier_and_contacts(config)
+        self.partner_ids = frozenset(self.supplier_and_contacts.ids)
+
+        sellers = env['product.supplierinfo'].search([('partner_id', 'in', self.supplier_and_contacts.ids)])
+        self.seller_ids = frozenset(sellers.ids)
+
+        variants = env['product.product'].search([('product_tmpl_id', 'in', sellers.product_tmpl_id.ids)])
+        variants_by_template = {}
+        for variant in variants:
+            variants_by_template.setdefault(variant.product_tmpl_id.id, set()).add(variant.id)
+
+        # Lowercased supplier product code -> ids of the product variants carrying it
+        self.code_products = {}
+        for seller in sellers:
+            code = (seller.product_code or '').strip().lower()
+            if code:
+                self.code_products.setdefault(code, set()).update(
+                    variants_by_template.get(seller.product_tmpl_id.id, set()))
+
+        self.mapping_plan = config._get_mapping_plan()
+        self.rule_matcher = config._get_rule_matcher()
+        self.rule_fields = IncomingProductInfo._get_rule_field_names(config)
+        self.product_cache = {}
+        self._supplier_products = {}
+
+        _logger.info(f"Import context for config {config.id}: {len(self.partner_ids)} partners, "
+                     f"{len(self.seller_ids)} supplier infos, {len(self.code_products)} supplier codes")
+
+    def get_code_products(self, *codes):
+        """
+        Return the ids of the product variants carrying any of the given
+        supplier product codes.
+        """
+        product_ids = set()
+        for code in codes:
+            product_ids |= self.code_products.get((code or '').strip().lower(), set())
+        return product_ids
+
+    def has_supplier(self, product):
+        """
+        Tell whether one of the supplier infos of a product belongs to the
+        supplier of the import.
+        """
+        if product.id not in self._supplier_products:
+            self._supplier_products[product.id] = not self.seller_ids.isdisjoint(product.seller_ids.ids)
+        return self._supplier_products[product.id]
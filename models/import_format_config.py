@@ -1,11 +1,44 @@
 import base64
+import io
 import logging
+from collections import namedtuple
 from odoo.exceptions import UserError
-from odoo import models, fields, api, _
-from .utils import process_csv, process_excel, log_and_notify
+from odoo import models, fields, api, tools, _
+from .rule_matcher import CombinationRuleMatcher
+from .utils import process_csv, process_excel, log_and_notify, open_binary_field, read_csv_header
 
 _logger = logging.getLogger(__name__)
 
+REQUIRED_FIELDS = ('sn', 'model_no')
+
+
+class MappingPlan(namedtuple('MappingPlan', ['columns', 'required_fields'])):
+    """
+    The column mappings of an import configuration compiled to plain data, so
+    rows can be mapped without touching the ORM and the plan can be pickled.
+
+    columns holds (source column, destination field) pairs in mapping order,
+    required_fields the destination fields every row needs a value for.
+    """
+    __slots__ = ()
+
+    def map_row(self, row):
+        values = {}
+        for source_column, dest_field in self.columns:
+            source_value = row.get(source_column, '').strip()
+            if source_value:
+                values[dest_field] = source_value
+
+        for field in self.required_fields:
+            if field not in values:
+                raise ValueError(f"Required field '{field}' is missing")
+
+        # Fall back to the model number as supplier product code
+        if not values.get('supplier_product_code'):
+            values['supplier_product_code'] = values.get('model_no', '')
+        return values
+
+
 class ImportFormatConfig(models.Model):
     _name = 'import.format.config'
     _description = 'Import Format Configuration'
@@ -16,6 +49,13 @@ class ImportFormatConfig(models.Model):
         ('csv', 'CSV'),
         ('excel', 'Excel')
     ], string='File Type', required=True)
+    duplicate_sn_policy = fields.Selection([
+        ('last', 'Keep Last Row'),
+        ('first', 'Keep First Row'),
+        ('error', 'Report as Error'),
+    ], string='Duplicate Serial Numbers', default='last', required=True,
+        help="What to do with rows repeating the serial number of an earlier row of the same file.")
+    sheet_name = fields.Char(string='Sheet Name', help="Name of the worksheet to import from Excel files. Leave empty to use the first worksheet.")
     column_mapping = fields.One2many('import.column.mapping', 'config_id', string='Column Mappings')
     supplier_id = fields.Many2one('res.partner', string='Supplier', domain=[('supplier_rank', '>', 0)], required=True)
     supplier_name = fields.Char(compute='_compute_supplier_name', string='Supplier Name')
@@ -25,6 +65,8 @@ class ImportFormatConfig(models.Model):
     previous_mappings = fields.Text(string='Previous Mappings')
     unmatched_model_ids = fields.One2many('unmatched.model.no', 'config_id', string='Unmatched Model Numbers')
     first_save = fields.Boolean(default=True, string="Is First Save")
+    mapping_version = fields.Integer(string='Mapping Version', default=0, readonly=True, copy=False,
+                                     help="Increased whenever the column mappings change, to invalidate the compiled mapping plan.")
 
     # New fields for report configuration
     report_worksheet_name = fields.Char(string='Report Worksheet Name', default='Product Info', translate=False)
@@ -101,6 +143,44 @@ class ImportFormatConfig(models.Model):
                 if mapping.destination_field_name == 'custom' and not mapping.custom_label:
                     raise UserError(_("Custom fields must have a label."))
                 
+    def _get_mapping_plan(self):
+        """
+        Return the compiled MappingPlan of the current column mappings.
+
+        The plan is cached on the mapping version and on the mappings
+        themselves, so a version reused after a rolled back change never
+        serves the plan of other mappings.
+        """
+        self.ensure_one()
+        columns = tuple(
+            (mapping.source_column, mapping.destination_field_name)
+            for mapping in self.column_mapping
+            if mapping.destination_field_name
+        )
+        return self._compile_mapping_plan(self.id, self.mapping_version, columns)
+
+    @api.model
+    @tools.ormcache('config_id', 'version', 'columns')
+    def _compile_mapping_plan(self, config_id, version, columns):
+        _logger.info(f"Compiled mapping plan for config {config_id} version {version}: {len(columns)} columns")
+        return MappingPlan(columns, REQUIRED_FIELDS)
+
+    def _get_rule_matcher(self):
+        """
+        Compile the combination rules for matching the rows of an import.
+        """
+        self.ensure_one()
+        return CombinationRuleMatcher(self.combination_rule_ids)
+
+    def _bump_mapping_version(self):
+        if not self.ids:
+            return
+        self.env.cr.execute("""
+            UPDATE import_format_config SET mapping_version = COALESCE(mapping_version, 0) + 1
+             WHERE id IN %s
+        """, (tuple(self.ids),))
+        self.invalidate_recordset(['mapping_version'])
+
     def _create_column_mappings(self):
         self.ensure_one()
         ImportColumnMapping = self.env['import.column.mapping']
@@ -230,24 +310,22 @@ class ImportFormatConfig(models.Model):
         if not self.sample_file:
             return
     
-        file_content = base64.b64decode(self.sample_file)
+        stream = open_binary_field(self, 'sample_file') or io.BytesIO(base64.b64decode(self.sample_file))
         
         try:
             if self.file_type == 'csv':
-                data_generator = process_csv(file_content)
+                # Only the header is needed, so don't read past the first few KB
+                column_names = read_csv_header(stream)
             elif self.file_type == 'excel':
-                data_generator = process_excel(file_content)
+                # Get the first chunk of data and use the keys of its first row as column names
+                columns = next(process_excel(stream, chunk_size=1, sheet_name=self.sheet_name), [])
+                column_names = list(columns[0].keys()) if columns else []
             else:
                 raise UserError(_('Unsupported file format.'))
     
-            # Get the first chunk of data
-            columns = next(data_generator, [])
-            if not columns:
+            if not column_names:
                 raise UserError(_('No data found in the file.'))
     
-            # Use the keys of the first row as column names
-            column_names = list(columns[0].keys()) if columns else []
-    
             ImportColumnMapping = self.env['import.column.mapping']
     
             # Take bort befintliga mappningar
@@ -267,7 +345,9 @@ class ImportFormatConfig(models.Model):
                 ImportColumnMapping.create(mapping_vals)
     
         except Exception as e:
-            log_and_notify(self,env, _("Error processing sample file: %s") % str(e), error_type="error")
+            log_and_notify(_("Error processing sample file: %s") % str(e), error_type="error")
+        finally:
+            stream.close()
     
     @api.depends('supplier_id')
     def _compute_actual_supplier(self):
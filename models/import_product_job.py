@@ -0,0 +1,662 @@
+import bisect
+import json
+import logging
+import math
+import multiprocessing
+import os
+import pickle
+import tempfile
+import threading
+from datetime import timedelta
+
+import psycopg2
+
+import odoo
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+from odoo.modules.registry import Registry
+from .dedup import SeenSerialNumbers
+from .import_run import ImportTelemetry
+from .utils import (
+    process_csv, process_excel, collect_errors, show_notification, open_binary_field, count_csv_rows,
+    count_excel_rows,
+)
+
+_logger = logging.getLogger(__name__)
+
+RUNNER_CRON_CODE = 'model._cron_run_jobs()'
+DEFAULT_WORKERS = 2
+STALE_JOB_MINUTES = 15
+HEARTBEAT_SECONDS = 60
+CHUNK_SIZE = 1000
+# Errors kept in the error log of a job, the others are only counted
+ERROR_LOG_LIMIT = 100
+
+# Connection pools inherited from the parent process by partition workers.
+# They are kept referenced and never closed from a worker: closing a
+# connection sends a terminate message over the socket it shares with the
+# parent, which would end the parent's session.
+_inherited_pools = []
+
+
+def _init_partition_worker(dbname):
+    """
+    Runs once in each forked partition worker, before any task. Make the
+    worker open its own database connections instead of sharing the ones
+    inherited from the parent.
+    """
+    # Locks held by other threads of the server at fork time are never
+    # released in the child, start from fresh ones
+    Registry._lock = threading.RLock()
+    _inherited_pools.append(odoo.sql_db._Pool)
+    odoo.sql_db._Pool = None
+    # The cached registry keeps a connection on the inherited pool, give it
+    # one on a pool of this worker
+    registry = odoo.registry(dbname)
+    registry._db = odoo.sql_db.db_connect(dbname)
+
+
+def _run_partition_task(args):
+    """
+    Import one row-range partition of a job's file in a worker process,
+    with its own cursor, and return the counters of the partition.
+    """
+    dbname, uid, job_id, spill_slice, first_row, last_row, skip_rows = args
+    registry = odoo.registry(dbname)
+    with registry.cursor() as cr:
+        env = api.Environment(cr, uid, {})
+        job = env['import.product.job'].browse(job_id).with_context(import_partition=True)
+        return job._run_partition(spill_slice, first_row, last_row, skip_rows)
+
+
+class ImportProductJob(models.Model):
+    _name = 'import.product.job'
+    _description = 'Product Info Import Job'
+    _order = 'id desc'
+
+    name = fields.Char(string='Name', compute='_compute_name', store=True)
+    import_config_id = fields.Many2one('import.format.config', string='Import Configuration', required=True, ondelete='cascade')
+    file = fields.Binary(string='File', required=True, attachment=True)
+    file_name = fields.Char(string='File Name')
+    user_id = fields.Many2one('res.users', string='Requested By', default=lambda self: self.env.user, required=True)
+    state = fields.Selection([
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled'),
+    ], string='Status', default='queued', required=True, index=True)
+    cancel_requested = fields.Boolean(string='Cancel Requested', readonly=True)
+    date_started = fields.Datetime(string='Started', readonly=True)
+    date_finished = fields.Datetime(string='Finished', readonly=True)
+    date_heartbeat = fields.Datetime(string='Last Progress', readonly=True)
+    rows_total = fields.Integer(string='Total Rows', readonly=True)
+    rows_processed = fields.Integer(string='Processed Rows', readonly=True)
+    created_count = fields.Integer(string='Created', readonly=True)
+    updated_count = fields.Integer(string='Updated', readonly=True)
+    unchanged_count = fields.Integer(string='Unchanged', readonly=True,
+                                     help="Existing records skipped because their row did not change since the last import.")
+    unmatched_count = fields.Integer(string='Unmatched Rows', readonly=True)
+    rule_without_product_count = fields.Integer(string='Rule Without Product', readonly=True)
+    duplicate_count = fields.Integer(string='Duplicates Dropped', readonly=True,
+                                     help="Rows repeating the serial number of an earlier row of the file.")
+    error_count = fields.Integer(string='Errors', readonly=True)
+    rows_per_second = fields.Float(string='Rows/sec', digits=(16, 1), readonly=True)
+    eta = fields.Datetime(string='ETA', readonly=True)
+    progress = fields.Float(string='Progress', compute='_compute_progress')
+    result_message = fields.Text(string='Import Result', readonly=True)
+    file_hash = fields.Char(string='File Checksum', readonly=True)
+    checkpoint_row = fields.Integer(string='Committed Rows', readonly=True,
+                                    help="Number of rows committed so far. A restarted run resumes after this row.")
+    error_log = fields.Text(string='Error Log', readonly=True,
+                            help="The first errors of the import with the serial number of their row.")
+    process_count = fields.Integer(string='Processes', default=1, required=True,
+                                   help="Number of processes the file is split over. "
+                                        "With more than one, row ranges of the file are imported in parallel.")
+
+    @api.depends('import_config_id', 'file_name')
+    def _compute_name(self):
+        for job in self:
+            job.name = f"{job.import_config_id.name or ''} - {job.file_name or _('Unnamed File')}"
+
+    @api.depends('state', 'rows_processed', 'rows_total')
+    def _compute_progress(self):
+        for job in self:
+            if job.state == 'done':
+                job.progress = 100.0
+            elif job.rows_total:
+                job.progress = min(100.0, 100.0 * job.rows_processed / job.rows_total)
+            else:
+                job.progress = 0.0
+
+    def action_cancel(self):
+        for job in self:
+            if job.state == 'queued':
+                job.write({'state': 'cancelled', 'date_finished': fields.Datetime.now()})
+            elif job.state == 'running':
+                # The runner checks this flag between chunks
+                job.cancel_requested = True
+        return True
+
+    def action_requeue(self):
+        for job in self:
+            if job.state not in ('failed', 'cancelled'):
+                raise UserError(_("Only failed or cancelled jobs can be queued again."))
+        self.write({
+            'state': 'queued',
+            'cancel_requested': False,
+            'date_started': False,
+            'date_finished': False,
+            'eta': False,
+        })
+        self._trigger_runners()
+        return True
+
+    @api.model
+    def _get_max_workers(self):
+        param = self.env['ir.config_parameter'].sudo().get_param(
+            'supplier_information_import.import_job_workers', DEFAULT_WORKERS)
+        try:
+            return max(1, int(param))
+        except (TypeError, ValueError):
+            return DEFAULT_WORKERS
+
+    @api.model
+    def _get_runner_crons(self):
+        return self.env['ir.cron'].sudo().with_context(active_test=False).search([
+            ('model_id.model', '=', self._name),
+            ('code', '=', RUNNER_CRON_CODE),
+        ], order='id')
+
+    @api.model
+    def _sync_runner_crons(self):
+        """
+        Keep one active runner cron per allowed parallel job. Each cron runs
+        one job at a time, so the number of active runners is the number of
+        jobs that can run in parallel.
+        """
+        runners = self._get_runner_crons()
+        if not runners:
+            return runners
+        max_workers = self._get_max_workers()
+        while len(runners) < max_workers:
+            runners |= runners[0].copy({
+                'name': _("Product Info Import: Job Runner %s") % (len(runners) + 1),
+            })
+        runners[:max_workers].filtered(lambda c: not c.active).write({'active': True})
+        runners[max_workers:].filtered('active').write({'active': False})
+        return runners[:max_workers]
+
+    @api.model
+    def _trigger_runners(self):
+        for cron in self._sync_runner_crons():
+            cron._trigger()
+
+    @api.model
+    def _cron_run_jobs(self):
+        self._requeue_stale_jobs()
+        job = self._claim_next_job()
+        while job:
+            job._run()
+            job = self._claim_next_job()
+
+    @api.model
+    def _requeue_stale_jobs(self):
+        """
+        Put running jobs back in the queue when their worker stopped
+        reporting progress, e.g. because it was killed.
+        """
+        limit = fields.Datetime.now() - timedelta(minutes=STALE_JOB_MINUTES)
+        stale = self.search([('state', '=', 'running'), ('date_heartbeat', '<', limit)])
+        if stale:
+            _logger.warning(f"Requeueing stale import jobs: {stale.ids}")
+            stale.write({'state': 'queued'})
+            self.env.cr.commit()
+
+    @api.model
+    def _claim_next_job(self):
+        """
+        Claim the oldest queued job in its own short transaction, so that
+        concurrent runners never pick up the same job.
+        """
+        # End the current transaction so the job is read back in a snapshot
+        # taken after the claim
+        self.env.cr.commit()
+        try:
+            with self.env.registry.cursor() as cr:
+                cr.execute("""
+                    SELECT id FROM import_product_job
+                     WHERE state = 'queued'
+                     ORDER BY id
+                     LIMIT 1
+                       FOR UPDATE SKIP LOCKED
+                """)
+                row = cr.fetchone()
+                if not row:
+                    return self.browse()
+                cr.execute("""
+                    UPDATE import_product_job
+                       SET state = 'running', date_started = now() at time zone 'UTC',
+                           date_heartbeat = now() at time zone 'UTC', cancel_requested = false
+                     WHERE id = %s
+                """, [row[0]])
+        except psycopg2.OperationalError:
+            # Another runner changed the job concurrently, let it have it
+            _logger.info("Could not claim an import job, retrying on the next run")
+            return self.browse()
+        self.invalidate_model()
+        return self.browse(row[0])
+
+    def _run(self):
+        self.ensure_one()
+        job = self.with_user(self.user_id)
+        config = job.import_config_id
+        _logger.info(f"Starting import job {job.id} for configuration {config.name}")
+        telemetry = ImportTelemetry(self.env.cr)
+        stream = None
+        try:
+            # Read the file straight from the filestore instead of decoding it in memory
+            with telemetry.stage('decode'):
+                stream = open_binary_field(job, 'file')
+            if not stream:
+                raise UserError(_('Please select a file to import.'))
+            # The file is read lazily by the parsers, account the reads to decode
+            stream = telemetry.wrap_stream(stream)
+            job.rows_total = self._estimate_total_rows(stream, config)
+            stream.seek(0)
+            self.env.cr.commit()
+
+            if job.process_count > 1 and job.rows_total > CHUNK_SIZE:
+                result = job._run_parallel(stream, telemetry)
+            else:
+                skip_rows = set()
+                if (config.duplicate_sn_policy or 'last') == 'last':
+                    with telemetry.stage('parse'):
+                        skip_rows = job._get_replaced_rows(stream)
+                    stream.seek(0)
+                result = self.env['import.product.info'].with_user(self.user_id).process_rows(
+                    job._read_file(stream), config, job=job, skip_rows=skip_rows, telemetry=telemetry)
+            message = job._format_result_message(result)
+            state = 'cancelled' if result.get('cancelled') else 'done'
+            job.write({
+                'state': state,
+                'date_finished': fields.Datetime.now(),
+                'eta': False,
+                'result_message': message,
+            })
+            self.env['import.run']._create_from_telemetry(job, telemetry, state)
+            self.env.cr.commit()
+            show_notification(job.env, message, _('Import Finished'),
+                              type='warning' if result['errors'] else 'success')
+        except Exception as e:
+            self.env.cr.rollback()
+            error_message = _("Error during file import: {}").format(str(e))
+            _logger.error(error_message, exc_info=True)
+            self.write({
+                'state': 'failed',
+                'date_finished': fields.Datetime.now(),
+                'eta': False,
+                'result_message': error_message,
+            })
+            self.env['import.run']._create_from_telemetry(self, telemetry, 'failed')
+            show_notification(job.env, error_message, _('Import Error'), type='danger')
+        finally:
+            if stream:
+                stream.close()
+        self.env.cr.commit()
+
+    def _read_file(self, stream):
+        self.ensure_one()
+        config = self.import_config_id
+        if config.file_type == 'csv':
+            return process_csv(stream, chunk_size=CHUNK_SIZE)
+        elif config.file_type == 'excel':
+            return process_excel(stream, chunk_size=CHUNK_SIZE, sheet_name=config.sheet_name)
+        raise UserError(_('Unsupported file format. Please use CSV or Excel files.'))
+
+    def _index_serial_numbers(self, stream, spill=None):
+        """
+        Read the whole file once and collect the row numbers of every serial
+        number that occurs more than once. The serial numbers seen so far are
+        kept in a SeenSerialNumbers, which moves to disk for very large files.
+
+        :param spill: Optional binary file the parsed chunks are pickled to,
+                      so partition workers read their rows without parsing
+                      the file again
+        :return: A (total_rows, duplicates, chunk_offsets) tuple where
+                 duplicates maps each repeated serial number to the list of
+                 its row numbers, and chunk_offsets lists the (first row,
+                 byte offset) of every chunk written to spill
+        """
+        self.ensure_one()
+        mapping_plan = self.import_config_id._get_mapping_plan()
+        seen_sns = SeenSerialNumbers()
+        duplicates = {}
+        chunk_offsets = []
+        total_rows = 0
+        try:
+            for chunk in self._read_file(stream):
+                if spill:
+                    chunk_offsets.append((total_rows + 1, spill.tell()))
+                    pickle.dump(chunk, spill, protocol=pickle.HIGHEST_PROTOCOL)
+                rows = []
+                for index, row in enumerate(chunk, start=total_rows + 1):
+                    try:
+                        rows.append((index, mapping_plan.map_row(row)['sn']))
+                    except Exception:
+                        continue
+                sns = dict(rows)
+                for index, first_row in seen_sns.check_chunk(rows).items():
+                    duplicates.setdefault(sns[index], [first_row]).append(index)
+                total_rows += len(chunk)
+        finally:
+            seen_sns.close()
+        return total_rows, duplicates, chunk_offsets
+
+    def _get_replaced_rows(self, stream):
+        """
+        Find the rows whose serial number occurs again later in the file.
+        Under the 'last' duplicate policy they are replaced by the later row,
+        so they are left out of the import instead of being written first.
+
+        :return: A set of row numbers
+        """
+        self.ensure_one()
+        total_rows, duplicates, chunk_offsets = self._index_serial_numbers(stream)
+        return {index for indexes in duplicates.values() for index in indexes[:-1]}
+
+    def _get_partitions(self, total_rows, duplicates):
+        """
+        Split the rows of the file in row ranges, one per process, aligned on
+        chunk boundaries.
+
+        When a serial number occurs in several partitions, the row the
+        duplicate policy of the config keeps wins, as it does in a sequential
+        import: its last row for the 'last' policy, its first row otherwise.
+        The other rows are skipped by their partition. This keeps the outcome
+        independent of the order in which the partitions finish.
+
+        :return: A list of (first_row, last_row, skip_rows) tuples
+        """
+        self.ensure_one()
+        chunks = math.ceil(total_rows / CHUNK_SIZE)
+        size = math.ceil(chunks / self.process_count) * CHUNK_SIZE
+        partitions = [(first, min(first + size - 1, total_rows), set())
+                      for first in range(1, total_rows + 1, size)]
+
+        keep_last = (self.import_config_id.duplicate_sn_policy or 'last') == 'last'
+        for indexes in duplicates.values():
+            winner = indexes[-1] if keep_last else indexes[0]
+            for index in indexes:
+                if index != winner and (index - 1) // size != (winner - 1) // size:
+                    partitions[(index - 1) // size][2].add(index)
+        return partitions
+
+    def _run_parallel(self, stream, telemetry):
+        """
+        Import the file with a pool of worker processes, one row-range
+        partition each, and merge their counters and telemetry.
+
+        The file is parsed once, by the coordinator, and its chunks are
+        pickled to a temporary file. Every worker reads the chunks of its
+        partition from their byte offset in that file.
+        """
+        self.ensure_one()
+        fd, spill_path = tempfile.mkstemp(prefix='import_partitions_', suffix='.pickle')
+        try:
+            with os.fdopen(fd, 'wb') as spill, telemetry.stage('parse'):
+                total_rows, duplicates, chunk_offsets = self._index_serial_numbers(stream, spill)
+            partitions = self._get_partitions(total_rows, duplicates)
+            _logger.info(f"Importing job {self.id} in {len(partitions)} partitions of {total_rows} rows")
+
+            self.write({'rows_total': total_rows, 'checkpoint_row': 0})
+            self.env.cr.commit()
+
+            chunk_starts = [first for first, offset in chunk_offsets]
+            tasks = []
+            for first, last, skip in partitions:
+                # The last chunk starting at or before the first row of the partition
+                chunk_start, offset = chunk_offsets[bisect.bisect_right(chunk_starts, first) - 1]
+                tasks.append((self.env.cr.dbname, self.user_id.id, self.id,
+                              (spill_path, offset, chunk_start - 1), first, last, skip))
+            result = {
+                'total': 0,
+                'created': 0,
+                'updated': 0,
+                'unchanged': 0,
+                'unmatched_rows': 0,
+                'rule_without_product': 0,
+                'duplicates': 0,
+                'errors': [],
+                'cancelled': False,
+            }
+            # Fork, so the workers reuse the loaded registry instead of loading their own
+            context = multiprocessing.get_context('fork')
+            with context.Pool(len(partitions), initializer=_init_partition_worker, initargs=(self.env.cr.dbname,),
+                              maxtasksperchild=1) as pool:
+                partition_results = pool.imap_unordered(_run_partition_task, tasks)
+                for __ in tasks:
+                    # Keep the heartbeat going while partitions run, or the job
+                    # is taken for stale and started again by another runner
+                    partition_result = None
+                    while partition_result is None and not result['cancelled']:
+                        try:
+                            partition_result = partition_results.next(timeout=HEARTBEAT_SECONDS)
+                        except multiprocessing.TimeoutError:
+                            result['cancelled'] = self._update_parallel_progress(result)
+                    if result['cancelled']:
+                        break
+                    for key in ('total', 'created', 'updated', 'unchanged', 'rule_without_product', 'duplicates'):
+                        result[key] += partition_result[key]
+                    result['unmatched_rows'] += partition_result['imported_unmatched_rows']
+                    result['errors'] += partition_result['errors']
+                    result['cancelled'] |= partition_result['cancelled']
+                    telemetry.merge(partition_result['telemetry'])
+                    result['cancelled'] |= self._update_parallel_progress(result)
+                    if result['cancelled']:
+                        break
+                if result['cancelled']:
+                    # The chunks the workers are in the middle of are rolled back
+                    _logger.info(f"Import job {self.id} cancelled, stopping its partition workers")
+                    pool.terminate()
+        finally:
+            os.unlink(spill_path)
+
+        result['errors'].sort(key=lambda error: error[0])
+        UnmatchedModelNo = self.env['unmatched.model.no']
+        config = self.import_config_id
+        result['unmatched'] = UnmatchedModelNo.search_count([('config_id', '=', config.id)])
+        return result
+
+    def _run_partition(self, spill_slice, first_row, last_row, skip_rows):
+        """
+        Import a partition from the chunks pickled by the coordinator.
+
+        :param spill_slice: A (path, byte offset, rows before) tuple locating
+                            the first chunk of the partition in the spill file
+        """
+        self.ensure_one()
+        path, offset, row_offset = spill_slice
+        with open(path, 'rb') as spill:
+            spill.seek(offset)
+            result = self.env['import.product.info'].process_rows(
+                self._read_spilled_chunks(spill), self.import_config_id, job=self,
+                row_range=(first_row, last_row), skip_rows=skip_rows, row_offset=row_offset)
+        result['errors'] = [(index, row, str(error)) for index, row, error in result['errors']]
+        return result
+
+    @api.model
+    def _read_spilled_chunks(self, spill):
+        while True:
+            try:
+                yield pickle.load(spill)
+            except EOFError:
+                return
+
+    def _update_parallel_progress(self, result):
+        """
+        Store the progress of a parallel import and tell whether a cancel was
+        requested.
+        """
+        # Workers only read the job, the coordinator is the only one writing
+        # to it. A concurrent cancel request only costs this progress update.
+        try:
+            self.env.cr.commit()
+            cancelled = self._check_cancelled()
+            self._update_progress(result)
+            self.env.cr.commit()
+            return cancelled
+        except psycopg2.OperationalError:
+            self.env.cr.rollback()
+            return False
+
+    @api.model
+    def _estimate_total_rows(self, stream, config):
+        try:
+            if config.file_type == 'csv':
+                return count_csv_rows(stream)
+            return count_excel_rows(stream, config.sheet_name)
+        except Exception:
+            return 0
+
+    def _format_result_message(self, result):
+        message = _(
+            'Processed {total} rows, created {created} new records, '
+            'updated {updated} existing records, '
+            'added {unmatched} to unmatched models.'
+        ).format(
+            total=result['total'],
+            created=result['created'],
+            updated=result['updated'],
+            unmatched=result['unmatched']
+        )
+        if result.get('unchanged'):
+            message += _(" Skipped {unchanged} unchanged records.").format(unchanged=result['unchanged'])
+        if result.get('duplicates'):
+            message += _(" Dropped {duplicates} rows repeating a serial number.").format(
+                duplicates=result['duplicates'])
+        if result.get('cancelled'):
+            message += _("\n\nThe import was cancelled before the end of the file.")
+        if result['errors']:
+            message += _("\n\nErrors occurred during import. Check the logs for details.")
+            message += "\n\n" + collect_errors(result['errors'][:20])
+        return message
+
+    def _check_cancelled(self):
+        """
+        Lock the job row for the coming chunk and tell whether a cancel was
+        requested. Cancel requests made while the chunk runs wait for the lock
+        and are seen before the next chunk.
+        """
+        self.ensure_one()
+        if self.env.context.get('import_partition'):
+            # Partition workers only read the flag, the coordinator owns the row
+            self.env.cr.execute("SELECT cancel_requested FROM import_product_job WHERE id = %s", [self.id])
+        else:
+            self.env.cr.execute(
+                "SELECT cancel_requested FROM import_product_job WHERE id = %s FOR UPDATE", [self.id])
+        row = self.env.cr.fetchone()
+        return bool(row and row[0])
+
+    def _get_file_hash(self):
+        self.ensure_one()
+        attachment = self.env['ir.attachment'].sudo().search([
+            ('res_model', '=', self._name),
+            ('res_field', '=', 'file'),
+            ('res_id', '=', self.id),
+        ], limit=1)
+        return attachment.checksum or False
+
+    def _get_checkpoint(self):
+        """
+        Return the running totals committed by a previous run of this job, or
+        an empty dict when the job starts from the beginning of the file.
+
+        A checkpoint is only used for the exact file it was taken for.
+        """
+        self.ensure_one()
+        if self.env.context.get('import_partition'):
+            return {}
+        file_hash = self._get_file_hash()
+        if not self.checkpoint_row or self.file_hash != file_hash:
+            self.write({
+                'file_hash': file_hash,
+                'checkpoint_row': 0,
+                'error_log': False,
+            })
+            return {}
+        _logger.info(f"Resuming import job {self.id} after row {self.checkpoint_row}")
+        logged_errors = [(index, {'sn': sn}, message) for index, sn, message in json.loads(self.error_log or '[]')]
+        return {
+            'total': self.checkpoint_row,
+            'created': self.created_count,
+            'updated': self.updated_count,
+            'unchanged': self.unchanged_count,
+            'unmatched_rows': self.unmatched_count,
+            'rule_without_product': self.rule_without_product_count,
+            'duplicates': self.duplicate_count,
+            'errors': logged_errors,
+            # Errors of the interrupted run that did not make it to the log
+            'error_offset': max(0, self.error_count - len(logged_errors)),
+        }
+
+    def _update_progress(self, result):
+        """
+        Store the running totals of the import, with the rows/sec rate and
+        the estimated time of arrival.
+
+        This is called right before a chunk is committed, so the totals and
+        the row offset are committed together with the chunk and serve as the
+        checkpoint a restarted run resumes from.
+        """
+        self.ensure_one()
+        if self.env.context.get('import_partition'):
+            # The coordinator reports the progress of partitioned imports
+            return
+        now = fields.Datetime.now()
+        elapsed = (now - self.date_started).total_seconds() if self.date_started else 0
+        rows_this_run = result['total'] - result.get('resumed_from', 0)
+        rate = rows_this_run / elapsed if elapsed > 0 else 0.0
+        eta = False
+        if rate and self.rows_total > result['total']:
+            eta = now + timedelta(seconds=(self.rows_total - result['total']) / rate)
+        vals = {
+            'rows_processed': result['total'],
+            'checkpoint_row': result['total'],
+            'created_count': result['created'],
+            'updated_count': result['updated'],
+            'unchanged_count': result.get('unchanged', 0),
+            'unmatched_count': result['unmatched_rows'],
+            'rule_without_product_count': result['rule_without_product'],
+            'duplicate_count': result.get('duplicates', 0),
+            'error_count': result.get('error_offset', 0) + len(result['errors']),
+            'rows_per_second': rate,
+            'eta': eta,
+            'date_heartbeat': now,
+        }
+        # Only the first errors are logged, with the serial number of their
+        # row, so the log stops growing once it is full
+        logged_count = min(len(result['errors']), ERROR_LOG_LIMIT)
+        if logged_count != min(self.error_count, ERROR_LOG_LIMIT):
+            mapping_plan = self.import_config_id._get_mapping_plan()
+            vals['error_log'] = json.dumps([
+                (index, self._get_error_sn(mapping_plan, row), str(error))
+                for index, row, error in result['errors'][:ERROR_LOG_LIMIT]
+            ])
+        self.write(vals)
+
+    @api.model
+    def _get_error_sn(self, mapping_plan, row):
+        """
+        :return: The serial number of the row of an error, or None when the
+                 row can't be mapped
+        """
+        if not isinstance(row, dict):
+            return None
+        if 'sn' in row and len(row) == 1:
+            # Row of an error logged by an interrupted run
+            return row['sn']
+        try:
+            return mapping_plan.map_row(row).get('sn')
+        except Exception:
+            return None
@@ -0,0 +1,255 @@
+import io
+import logging
+import os
+import resource
+import time
+from contextlib import contextmanager
+
+from odoo import models, fields, api, _
+
+_logger = logging.getLogger(__name__)
+
+IMPORT_STAGES = ('decode', 'parse', 'map', 'match', 'unmatched', 'create', 'write', 'commit')
+
+
+def get_current_rss():
+    """
+    :return: The current resident memory of the process in kilobytes, or
+             its peak resident memory where the current one is not available
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class TimedStream(io.BufferedIOBase):
+    """
+    A binary file object that accounts the time spent reading the file it
+    wraps to the decode stage of an ImportTelemetry.
+    """
+
+    def __init__(self, stream, telemetry):
+        super().__init__()
+        self.stream = stream
+        self.telemetry = telemetry
+
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self.telemetry.add_decode_time(time.perf_counter() - start)
+
+    def read(self, size=-1):
+        return self._timed(self.stream.read, size)
+
+    def read1(self, size=-1):
+        return self._timed(getattr(self.stream, 'read1', self.stream.read), size)
+
+    def readinto(self, buffer):
+        return self._timed(self.stream.readinto, buffer)
+
+    def readline(self, size=-1):
+        return self._timed(self.stream.readline, size)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self.stream.seek(offset, whence)
+
+    def tell(self):
+        return self.stream.tell()
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return self.stream.seekable()
+
+    def close(self):
+        self.stream.close()
+        super().close()
+
+
+class ImportTelemetry:
+    """
+    Collects the wall time and row count of every stage of one import, the
+    number of SQL queries it ran and how far the memory of the process grew
+    over the one it had when the import started. The memory is sampled at
+    the end of every stage, as the peak memory of the process covers its
+    whole life, earlier imports included.
+
+    The collected values are plain data, so the telemetry of the partitions
+    of a parallel import can be sent back to the coordinator and merged.
+    """
+
+    def __init__(self, cr):
+        self.cr = cr
+        self.started = time.perf_counter()
+        self.query_count_start = cr.sql_log_count
+        self.times = dict.fromkeys(IMPORT_STAGES, 0.0)
+        self.rows = dict.fromkeys(IMPORT_STAGES, 0)
+        self.extra_query_count = 0
+        self.extra_peak_rss = 0
+        self.start_rss = get_current_rss()
+        self.peak_rss = self.start_rss
+        # Rows committed by an interrupted run this run resumed after
+        self.resumed_rows = 0
+
+    def wrap_stream(self, stream):
+        """
+        Wrap the file an import reads, so the time spent reading it is
+        accounted to the decode stage whichever stage reads it.
+        """
+        return TimedStream(stream, self)
+
+    def add_decode_time(self, elapsed):
+        self.times['decode'] += elapsed
+
+    @contextmanager
+    def stage(self, name, rows=0):
+        start = time.perf_counter()
+        decode_start = self.times['decode']
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            if name != 'decode':
+                # Reading the file within the stage is accounted to decode
+                elapsed -= self.times['decode'] - decode_start
+            self.times[name] += elapsed
+            self.rows[name] += rows
+            self.sample_rss()
+
+    def sample_rss(self):
+        self.peak_rss = max(self.peak_rss, get_current_rss())
+
+    def iter_chunks(self, data):
+        """
+        Iterate over the chunks of a file reader, accounting the time spent
+        parsing them to the parse stage, and the time spent reading the file
+        they come from to the decode stage.
+        """
+        data = iter(data)
+        while True:
+            start = time.perf_counter()
+            decode_start = self.times['decode']
+            chunk = next(data, None)
+            self.times['parse'] += time.perf_counter() - start - (self.times['decode'] - decode_start)
+            self.sample_rss()
+            if chunk is None:
+                return
+            self.rows['parse'] += len(chunk)
+            yield chunk
+
+    def get_stats(self):
+        """
+        :return: A dict with the stage timings and counters collected so far
+        """
+        return {
+            'times': dict(self.times),
+            'rows': dict(self.rows),
+            'query_count': self.cr.sql_log_count - self.query_count_start + self.extra_query_count,
+            'peak_rss': max(self.peak_rss - self.start_rss, self.extra_peak_rss),
+        }
+
+    def merge(self, stats):
+        """
+        Add the stats of another process, e.g. a partition worker.
+        """
+        for name in IMPORT_STAGES:
+            self.times[name] += stats['times'][name]
+            self.rows[name] += stats['rows'][name]
+        self.extra_query_count += stats['query_count']
+        self.extra_peak_rss = max(self.extra_peak_rss, stats['peak_rss'])
+
+    def get_run_values(self, rows_total):
+        """
+        :param rows_total: The rows processed by the import, including the
+                           ones of an interrupted run it resumed after
+        """
+        stats = self.get_stats()
+        wall_time = time.perf_counter() - self.started
+        rows_this_run = max(0, rows_total - self.resumed_rows)
+        vals = {
+            'wall_time': wall_time,
+            'rows_total': rows_total,
+            'rows_per_second': rows_this_run / wall_time if wall_time else 0.0,
+            'sql_query_count': stats['query_count'],
+            'peak_rss_mb': stats['peak_rss'] / 1024.0,
+        }
+        for name in IMPORT_STAGES:
+            vals[f'{name}_time'] = stats['times'][name]
+            vals[f'{name}_rows'] = stats['rows'][name]
+        return vals
+
+
+class ImportRun(models.Model):
+    _name = 'import.run'
+    _description = 'Product Info Import Run'
+    _order = 'id desc'
+
+    job_id = fields.Many2one('import.product.job', string='Import Job', ondelete='set null', index=True)
+    import_config_id = fields.Many2one('import.format.config', string='Import Configuration', ondelete='cascade', index=True)
+    supplier_id = fields.Many2one(related='import_config_id.supplier_id', string='Supplier', store=True)
+    file_name = fields.Char(string='File Name')
+    state = fields.Selection([
+        ('done', 'Done'),
+        ('cancelled', 'Cancelled'),
+        ('failed', 'Failed'),
+    ], string='Status', required=True, default='done')
+    process_count = fields.Integer(string='Processes', default=1, group_operator='max')
+    date_started = fields.Datetime(string='Started')
+    date_finished = fields.Datetime(string='Finished')
+
+    wall_time = fields.Float(string='Wall Time (s)', digits=(16, 3))
+    rows_total = fields.Integer(string='Rows')
+    rows_per_second = fields.Float(string='Rows/Second', digits=(16, 1), group_operator='avg')
+    sql_query_count = fields.Integer(string='SQL Queries')
+    peak_rss_mb = fields.Float(string='Peak Memory Increase (MB)', digits=(16, 1), group_operator='max',
+                               help="How far the memory of the import process grew over the one it had when the import started.")
+
+    decode_time = fields.Float(string='Decode Time (s)', digits=(16, 3))
+    decode_rows = fields.Integer(string='Decode Rows')
+    parse_time = fields.Float(string='Parse Time (s)', digits=(16, 3))
+    parse_rows = fields.Integer(string='Parse Rows')
+    map_time = fields.Float(string='Map Time (s)', digits=(16, 3))
+    map_rows = fields.Integer(string='Map Rows')
+    match_time = fields.Float(string='Match Time (s)', digits=(16, 3))
+    match_rows = fields.Integer(string='Match Rows')
+    unmatched_time = fields.Float(string='Unmatched Time (s)', digits=(16, 3))
+    unmatched_rows = fields.Integer(string='Unmatched Rows')
+    create_time = fields.Float(string='Create Time (s)', digits=(16, 3))
+    create_rows = fields.Integer(string='Create Rows')
+    write_time = fields.Float(string='Write Time (s)', digits=(16, 3))
+    write_rows = fields.Integer(string='Write Rows')
+    commit_time = fields.Float(string='Commit Time (s)', digits=(16, 3))
+    commit_rows = fields.Integer(string='Commit Rows')
+
+    def name_get(self):
+        return [(run.id, f"{run.import_config_id.name or _('Import')} #{run.id}") for run in self]
+
+    @api.model
+    def _create_from_telemetry(self, job, telemetry, state):
+        """
+        Store the telemetry of an import job.
+
+        :param job: The import.product.job that ran
+        :param telemetry: The ImportTelemetry collected while it ran
+        :param state: The final state of the run
+        """
+        vals = telemetry.get_run_values(job.rows_processed)
+        vals.update({
+            'job_id': job.id,
+            'import_config_id': job.import_config_id.id,
+            'file_name': job.file_name,
+            'state': state,
+            'process_count': job.process_count,
+            'date_started': job.date_started,
+            'date_finished': job.date_finished,
+        })
+        run = self.sudo().create(vals)
+        _logger.info(f"Import run {run.id}: {run.rows_total} rows in {run.wall_time:.2f}s, "
+                     f"{run.sql_query_count} queries, peak memory increase {run.peak_rss_mb:.1f} MB")
+        return run
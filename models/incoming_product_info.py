@@ -1,11 +1,16 @@
-from odoo import models, fields, api, _
-from odoo.exceptions import UserError
-import logging
-import re
+from odoo import models, fields, api
+import hashlib
 import json
+import logging
+from contextlib import nullcontext
+
+from .import_context import ImportContext
 
 _logger = logging.getLogger(__name__)
 
+# Fields set outside of the import, they don't change the content of a row
+NON_CONTENT_FIELDS = {'state', 'lot_id', 'stock_picking_id', 'result_message', 'content_hash'}
+
 class IncomingProductInfo(models.Model):
     _name = 'incoming.product.info'
     _description = 'Incoming Product Information'
@@ -36,7 +41,13 @@ class IncomingProductInfo(models.Model):
     ], string='Status', default='pending')
     lot_id = fields.Many2one('stock.lot', string='Lot/Serial Number')
     result_message = fields.Text(string='Import Result', readonly=True)
+    content_hash = fields.Char(string='Content Hash', readonly=True, copy=False,
+                               help="Hash of the imported values, unchanged rows are skipped when the file is imported again.")
 
+    _sql_constraints = [
+        ('supplier_sn_uniq', 'unique(supplier_id, sn)',
+         'A serial number can only be imported once per supplier.'),
+    ]
 
     @api.depends('supplier_product_code', 'sn')
     def _compute_name(self):
@@ -44,67 +55,139 @@ class IncomingProductInfo(models.Model):
             record.name = f"{record.supplier_product_code or ''} - {record.sn or ''}"
 
     @api.model
-    def _search_product(self, values, config):
+    def _search_product(self, values, config, import_context=None):
         try:
             _logger.info(f"Starting _search_product with values: {values}")
-            supplier = config.supplier_id
-            main_supplier = supplier.parent_id or supplier
-            supplier_domain = [
-                '|', '|',
-                ('id', '=', main_supplier.id),
-                ('parent_id', '=', main_supplier.id),
-                ('id', 'child_of', main_supplier.id)
-            ]
-            supplier_and_contacts = self.env['res.partner'].search(supplier_domain)
-            
-            model_no = values.get('model_no', '')
-            model_no_lower = model_no.strip().lower()
-            supplier_product_code = values.get('supplier_product_code') or model_no
-            supplier_product_code_lower = supplier_product_code.strip().lower()
-    
-            # 1. Check Combination Rules
-            rule_product = self._check_combination_rules(values, config, supplier_and_contacts)
-            if rule_product:
-                if rule_product == 'rule_without_product':
-                    _logger.info(f"Combination rule found but no product assigned for model_no: {model_no}")
-                    return 'rule_without_product'
-                else:
-                    _logger.info(f"Product found via Combination Rules: {rule_product.name}")
-                    return rule_product
-    
-            # 2. Check Unmatched Model No
-            unmatched_product = self._check_unmatched_model(model_no, config, supplier_and_contacts)
-            if unmatched_product:
-                _logger.info(f"Product found via Unmatched Model No: {unmatched_product.name}")
-                return unmatched_product
-    
-            # 3. Check against supplier product code
-            domain = [
-                '|',
-                ('seller_ids.product_code', '=ilike', supplier_product_code_lower),
-                ('seller_ids.product_code', '=ilike', model_no_lower),
-                ('seller_ids.partner_id', 'in', supplier_and_contacts.ids)
-            ]
-            products = self.env['product.product'].search(domain)
-    
-            if len(products) == 1:
-                _logger.info(f"Product found via supplier product code: {products.name}")
-                return products
-            elif len(products) > 1:
-                _logger.warning(f"Multiple products found for supplier_product_code {supplier_product_code}. Treating as unmatched.")
-                return False
-    
-            _logger.info(f"No product found for model_no {model_no} and supplier_product_code {supplier_product_code}")
-            
-            # 4. Add to unmatched models if no product found
-            self._add_to_unmatched_models(values, config)
-            
-            return False
-    
+            import_context = import_context or self._get_import_context(config)
+            resolved = self._resolve_products([values], config, import_context)
+            product, rule_ids = resolved[self._get_product_key(values, import_context.rule_fields)]
+
+            self.env['import.combination.rule']._record_hits(
+                (rule_id, values.get('sn')) for rule_id in rule_ids)
+
+            if not product:
+                self._add_to_unmatched_models(values, config)
+            return product
+
         except Exception as e:
             _logger.error(f"Error in _search_product: {str(e)}", exc_info=True)
             return False
 
+    @api.model
+    def _get_import_context(self, config):
+        """
+        Build the lookups shared by every row of an import of config.
+
+        :return: An ImportContext to pass on to the product search methods
+        """
+        return ImportContext(self.env, config)
+
+    @api.model
+    def _get_supplier_and_contacts(self, config):
+        supplier = config.supplier_id
+        main_supplier = supplier.parent_id or supplier
+        supplier_domain = [
+            '|', '|',
+            ('id', '=', main_supplier.id),
+            ('parent_id', '=', main_supplier.id),
+            ('id', 'child_of', main_supplier.id)
+        ]
+        return self.env['res.partner'].search(supplier_domain)
+
+    @api.model
+    def _get_rule_field_names(self, config):
+        rules = config.combination_rule_ids
+        field_names = set(rules.mapped('field_1.destination_field_name'))
+        field_names |= set(rules.mapped('field_2.destination_field_name'))
+        return tuple(sorted(name for name in field_names if name))
+
+    @api.model
+    def _get_product_key(self, values, rule_fields):
+        """
+        Build the key under which the product of a mapped row is resolved.
+
+        Besides model_no and supplier_product_code the key holds the values of
+        every field used by a combination rule, since those decide the match.
+        """
+        model_no = values.get('model_no', '')
+        supplier_product_code = values.get('supplier_product_code') or model_no
+        return (model_no, supplier_product_code) + tuple(values.get(name, '') for name in rule_fields)
+
+    @api.model
+    def _resolve_products(self, values_list, config, import_context=None):
+        """
+        Resolve the products of a batch of mapped rows with set-based queries.
+
+        Rows are resolved per distinct product key, in the same priority order
+        as before: combination rules, unmatched model mappings, supplier product
+        codes.
+
+        :param values_list: A list of mapped row values
+        :param config: The import.format.config used for the import
+        :param import_context: Optional ImportContext of the import, its product
+                               cache holds the keys resolved by earlier batches
+        :return: A dict mapping product keys to a (product, rule_ids) tuple where
+                 product is a product.product record, 'rule_without_product' or
+                 False and rule_ids are the combination rules hit by the key
+        """
+        import_context = import_context or self._get_import_context(config)
+        cache = import_context.product_cache
+
+        pending = {}
+        for values in values_list:
+            key = self._get_product_key(values, import_context.rule_fields)
+            if key not in cache and key not in pending:
+                pending[key] = values
+        if not pending:
+            return cache
+
+        # 1. Check Combination Rules
+        unresolved = []
+        for key, values in pending.items():
+            rule_product, rule_ids = self._match_combination_rules(values, config, import_context)
+            if rule_product:
+                cache[key] = (rule_product, rule_ids)
+            else:
+                unresolved.append((key, rule_ids))
+        if not unresolved:
+            return cache
+
+        # 2. Check Unmatched Model No
+        unmatched_products = self._get_unmatched_model_products(
+            {key[0] for key, rule_ids in unresolved}, config, import_context)
+
+        # 3. Check against supplier product code
+        Product = self.env['product.product']
+        for key, rule_ids in unresolved:
+            model_no, supplier_product_code = key[0], key[1]
+            product = unmatched_products.get(model_no)
+            if not product:
+                product_ids = import_context.get_code_products(supplier_product_code, model_no)
+                if len(product_ids) == 1:
+                    product = Product.browse(tuple(product_ids))
+                elif len(product_ids) > 1:
+                    _logger.warning(f"Multiple products found for supplier_product_code {supplier_product_code}. Treating as unmatched.")
+                    product = False
+                else:
+                    _logger.info(f"No product found for model_no {model_no} and supplier_product_code {supplier_product_code}")
+                    product = False
+            cache[key] = (product, rule_ids)
+
+        return cache
+
+    @api.model
+    def _get_unmatched_model_products(self, model_nos, config, import_context):
+        unmatched = self.env['unmatched.model.no'].search([
+            ('config_id', '=', config.id),
+            ('model_no', 'in', list(model_nos)),
+            ('supplier_id', 'in', list(import_context.partner_ids)),
+            ('product_id', '!=', False)
+        ])
+        products = {}
+        for record in unmatched:
+            products.setdefault(record.model_no, record.product_id)
+        return products
+
     @api.model
     def find_or_create(self, values):
         existing = self.search([
@@ -118,107 +201,248 @@ class IncomingProductInfo(models.Model):
         else:
             return self.create(values), True  # True indicates it's a new record
 
+    @api.model
+    def _get_existing_by_sn(self, supplier_id, sns):
+        """
+        Load the existing records of a supplier for a set of serial numbers.
+
+        :return: A dict mapping sn to an (id, state, content_hash) tuple
+        """
+        if not sns:
+            return {}
+        self.flush_model(['supplier_id', 'sn', 'state', 'content_hash'])
+        self.env.cr.execute("""
+            SELECT sn, id, state, content_hash FROM incoming_product_info
+             WHERE supplier_id = %s AND sn IN %s
+        """, (supplier_id, tuple(sns)))
+        return {sn: (record_id, state, content_hash) for sn, record_id, state, content_hash in self.env.cr.fetchall()}
+
+    @api.model
+    def _get_content_hash(self, vals):
+        """
+        Hash the imported values of a row, independent of their order.
+        """
+        content = sorted((name, value) for name, value in vals.items() if name not in NON_CONTENT_FIELDS)
+        return hashlib.sha1(json.dumps(content, default=str).encode()).hexdigest()
+
+    @api.model
+    def _upsert_rows(self, supplier_id, vals_list, telemetry=None):
+        """
+        Create or update records keyed on (supplier_id, sn).
+
+        Existing records keep their current state, new records are created as
+        'received' since we're importing existing data. When a serial number
+        occurs more than once in vals_list the last occurrence wins. Existing
+        records whose content hash equals the one of their row are skipped.
+
+        :param supplier_id: The id of the supplier the rows belong to
+        :param vals_list: A list of dictionaries with the values of each row
+        :param telemetry: Optional ImportTelemetry to account the create and
+                          write stages to
+        :return: A (created_records, updated_count, skipped_count) tuple
+        """
+        vals_by_sn = {}
+        for vals in vals_list:
+            vals_by_sn[vals['sn']] = vals
+
+        with telemetry.stage('write') if telemetry else nullcontext():
+            existing = self._get_existing_by_sn(supplier_id, list(vals_by_sn))
+
+        create_vals = []
+        write_vals = {}
+        skipped = 0
+        for sn, vals in vals_by_sn.items():
+            vals['content_hash'] = self._get_content_hash(vals)
+            if sn in existing:
+                record_id, state, content_hash = existing[sn]
+                if content_hash == vals['content_hash']:
+                    # Same content as the last import, nothing to write
+                    skipped += 1
+                    continue
+                vals['state'] = state
+                write_vals[record_id] = vals
+            else:
+                vals['state'] = 'received'
+                create_vals.append(vals)
+
+        with telemetry.stage('create', len(create_vals)) if telemetry else nullcontext():
+            created = self.create(create_vals) if create_vals else self.browse()
+            # Flush here, so the INSERT is accounted to the create stage
+            self.flush_model()
+        with telemetry.stage('write', len(write_vals)) if telemetry else nullcontext():
+            if write_vals:
+                self._bulk_write(write_vals)
+        return created, len(write_vals), skipped
+
+    @api.model
+    def _bulk_write(self, vals_by_id):
+        """
+        Write different values on many records with one UPDATE per set of
+        written fields instead of one write() per record.
+
+        Only plain stored columns are written, the same way write() does:
+        access rights and rules are checked first, an empty supplier product
+        code falls back to the model number and the content hash is cleared
+        unless it is written. The stored fields computed from the written
+        ones (name and product_tmpl_id) are filled in as well, so nothing is
+        left for the ORM to recompute afterwards, and the whole cache is
+        invalidated so no field computed from the old values is served.
+
+        :param vals_by_id: A dict mapping record ids to the values to write
+        """
+        records = self.browse(list(vals_by_id))
+        self.check_access_rights('write')
+        records.check_access_rule('write')
+        products = self.env['product.product'].browse(
+            {vals['product_id'] for vals in vals_by_id.values() if vals.get('product_id')})
+        template_by_product = {product.id: product.product_tmpl_id.id for product in products}
+        sn_by_id = {record.id: record.sn for record in records}
+
+        groups = {}
+        for record_id, vals in vals_by_id.items():
+            vals = {name: value for name, value in vals.items()
+                    if name in self._fields and self._is_plain_column(self._fields[name])
+                    and name not in ('id', 'sn', 'supplier_id')}
+            if 'content_hash' not in vals and set(vals) - NON_CONTENT_FIELDS:
+                vals['content_hash'] = False
+            if not vals.get('supplier_product_code'):
+                vals['supplier_product_code'] = vals.get('model_no', '')
+            vals['name'] = f"{vals['supplier_product_code'] or ''} - {sn_by_id.get(record_id) or ''}"
+            if 'product_id' in vals:
+                vals['product_tmpl_id'] = template_by_product.get(vals['product_id'] or 0)
+            groups.setdefault(tuple(sorted(vals)), []).append((record_id, vals))
+
+        self.check_field_access_rights('write', list({name for fnames in groups for name in fnames}))
+        self.flush_model()
+        for fnames, rows in groups.items():
+            columns = ', '.join(f'"{name}"' for name in fnames)
+            casts = ', '.join(f'v."{name}"::{self._fields[name].column_type[1]}' for name in fnames)
+            params = [
+                (record_id,) + tuple(self._fields[name].convert_to_column(vals[name], self) for name in fnames)
+                for record_id, vals in rows
+            ]
+            query = f"""
+                UPDATE "{self._table}" AS t
+                   SET ({columns}, write_uid, write_date) = ({casts}, %s, now() at time zone 'UTC')
+                  FROM (VALUES {', '.join(['%s'] * len(params))}) AS v(id, {columns})
+                 WHERE t.id = v.id
+            """
+            self.env.cr.execute(query, [self.env.uid] + params)
+
+        self.env.invalidate_all()
+
+    @api.model
+    def _is_plain_column(self, field):
+        """
+        Tell whether a field is a stored column written as is, without a
+        compute, related or inverse method of its own.
+        """
+        return bool(field.store and field.column_type and not field.compute
+                    and not field.related and not field.inverse)
+
     @api.model
     def _check_serial_number(self, values, product):
+        lots = self._get_serial_number_lots([(values['sn'], product)])
+        return lots[(values['sn'], product.id)]
+
+    @api.model
+    def _get_serial_number_lots(self, pairs, lot_vals=None):
+        """
+        Find or create the lots of many serial numbers at once.
+
+        Existing lots are fetched with one query per company and the missing
+        ones are created with a single create per company. Lots are looked up
+        in the company of the product, or the current company for products
+        shared between companies.
+
+        :param pairs: An iterable of (sn, product) tuples
+        :param lot_vals: Optional dict mapping (sn, product id) to extra values
+                         of the lots created for them
+        :return: A dict mapping (sn, product id) to a (lot, state) tuple where
+                 state is 'received' for an existing lot and 'pending' for a
+                 created one
+        """
         StockLot = self.env['stock.lot']
-        existing_lot = StockLot.search([
-            ('name', '=', values['sn']),
-            ('product_id', '=', product.id),
-            ('company_id', '=', self.env.company.id)
-        ], limit=1)
+        keys_by_company = {}
+        for sn, product in pairs:
+            company = product.company_id or self.env.company
+            keys_by_company.setdefault(company.id, set()).add((sn, product.id))
 
-        if existing_lot:
-            _logger.info(f"Matched existing lot for SN: {values['sn']}")
-            return existing_lot, 'received'
-        else:
-            new_lot = StockLot.create({
-                'name': values['sn'],
-                'product_id': product.id,
-                'company_id': self.env.company.id,
-            })
-            _logger.info(f"Created new lot for SN: {values['sn']}")
-            return new_lot, 'pending'
-
-    def _check_combination_rules(self, values, config, supplier_and_contacts):
+        result = {}
+        for company_id, keys in keys_by_company.items():
+            lots = StockLot.search([
+                ('name', 'in', list({sn for sn, product_id in keys})),
+                ('product_id', 'in', list({product_id for sn, product_id in keys})),
+                ('company_id', '=', company_id),
+            ])
+            existing = {}
+            for lot in lots:
+                existing.setdefault((lot.name, lot.product_id.id), lot)
+
+            missing = sorted(key for key in keys if key not in existing)
+            new_lots = StockLot.create([dict(
+                (lot_vals or {}).get((sn, product_id), {}),
+                name=sn,
+                product_id=product_id,
+                company_id=company_id,
+            ) for sn, product_id in missing])
+
+            for key in keys:
+                if key in existing:
+                    result[key] = (existing[key], 'received')
+            for key, lot in zip(missing, new_lots):
+                result[key] = (lot, 'pending')
+            _logger.info(f"Matched {len(keys) - len(missing)} existing lots and created {len(missing)} new lots "
+                         f"for company {company_id}")
+        return result
+
+    def _check_combination_rules(self, values, config, import_context):
         ImportCombinationRule = self.env['import.combination.rule']
-        for rule in config.combination_rule_ids:
-            field1_value = values.get(rule.field_1.destination_field_name, '').strip().lower()
-            field2_value = values.get(rule.field_2.destination_field_name, '').strip().lower()
-            
-            _logger.info(f"Checking rule: {rule.name}, Field1: {field1_value}, Field2: {field2_value}")
-            
-            if (rule.value_1.lower() in field1_value and rule.value_2.lower() in field2_value):
-                # Update the rule count
-                ImportCombinationRule.update_rule_count(rule.id, values.get('sn'))
-                
-                if rule.product_id:
-                    matching_supplier = rule.product_id.seller_ids.filtered(
-                        lambda s: s.partner_id in supplier_and_contacts
-                    )
-                    if matching_supplier:
-                        _logger.info(f"Matched rule: {rule.name} for product: {rule.product_id.name}")
-                        return rule.product_id
-                    else:
-                        _logger.warning(f"Rule {rule.name} matched but no matching supplier found for product {rule.product_id.name}")
+        result, rule_ids = self._match_combination_rules(values, config, import_context)
+        # Update the rule count
+        ImportCombinationRule._record_hits((rule_id, values.get('sn')) for rule_id in rule_ids)
+        return result
+
+    def _match_combination_rules(self, values, config, import_context):
+        """
+        Match the values of a row against the combination rules of a config.
+
+        :return: A (result, rule_ids) tuple where result is the rule product,
+                 'rule_without_product' or False, and rule_ids are the ids of
+                 every rule hit on the way, in order
+        """
+        rule_ids = []
+        Product = self.env['product.product']
+        for rule in import_context.rule_matcher.match(values):
+            rule_ids.append(rule.id)
+
+            if rule.product_id:
+                product = Product.browse(rule.product_id)
+                if import_context.has_supplier(product):
+                    _logger.info(f"Matched rule: {rule.name} for product: {product.name}")
+                    return product, rule_ids
                 else:
-                    _logger.info(f"Rule {rule.name} matched but no product assigned")
-                    return 'rule_without_product'
-        
-        _logger.info("No matching rule found")
-        return False
-    def _check_unmatched_model(self, model_no, config, supplier_and_contacts):
+                    _logger.warning(f"Rule {rule.name} matched but no matching supplier found for product {product.name}")
+            else:
+                _logger.info(f"Rule {rule.name} matched but no product assigned")
+                return 'rule_without_product', rule_ids
+
+        return False, rule_ids
+
+    def _check_unmatched_model(self, model_no, config, import_context):
         UnmatchedModelNo = self.env['unmatched.model.no']
         unmatched = UnmatchedModelNo.search([
             ('config_id', '=', config.id),
             ('model_no', '=', model_no),
-            ('supplier_id', 'in', supplier_and_contacts.ids),
+            ('supplier_id', 'in', list(import_context.partner_ids)),
             ('product_id', '!=', False)
         ], limit=1)
         return unmatched.product_id if unmatched else False
 
     @api.model
     def _add_to_unmatched_models(self, values, config):
-        UnmatchedModelNo = self.env['unmatched.model.no']
-        model_no = values.get('model_no', '')
-        model_no_lower = model_no.strip().lower()
-        existing = UnmatchedModelNo.search([
-            ('config_id', '=', config.id),
-            ('model_no_lower', '=', model_no_lower)
-        ], limit=1)
-    
-        # Create a unique identifier for this row
-        row_identifier = f"{values.get('sn', '')}-{values.get('supplier_product_code', '')}"
-    
-        if existing:
-            # Load existing raw_data
-            existing_data = json.loads(existing.raw_data) if existing.raw_data else {}
-            
-            if row_identifier not in existing_data:
-                existing_data[row_identifier] = values
-                
-                # Update the model_no with the new casing if it's different
-                if existing.model_no != model_no and model_no not in existing.model_no.split(' / '):
-                    existing.model_no = f"{existing.model_no} / {model_no}"
-                
-                existing.write({
-                    'raw_data': json.dumps(existing_data),
-                    'count': len(existing_data)
-                })
-            _logger.info(f"Updated unmatched model: {existing.model_no}, new count: {len(existing_data)}")
-        else:
-            new_data = {row_identifier: values}
-            UnmatchedModelNo.create({
-                'config_id': config.id,
-                'supplier_id': config.supplier_id.id,
-                'model_no': model_no,
-                'model_no_lower': model_no_lower,
-                'pn': values.get('pn', ''),
-                'product_code': values.get('supplier_product_code') or values.get('product_code') or model_no,
-                'supplier_product_code': values.get('supplier_product_code') or model_no,
-                'raw_data': json.dumps(new_data),
-                'count': 1
-            })
-            _logger.info(f"Added new unmatched model: {model_no}")
+        self.env['unmatched.model.no']._add_rows([values], config)
+
     def _check_model_no_against_product_code(self, model_no, config, supplier_ids):
         domain = [
             ('seller_ids.name', 'in', supplier_ids),
@@ -270,39 +494,20 @@ class IncomingProductInfo(models.Model):
         """
         if 'supplier_product_code' in vals and not vals['supplier_product_code']:
             vals['supplier_product_code'] = self.model_no or ''
+        if 'content_hash' not in vals and set(vals) - NON_CONTENT_FIELDS:
+            # Edited outside of an import, make the next import write the row again
+            vals['content_hash'] = False
         return super(IncomingProductInfo, self).write(vals)
 
     @api.model
-    def _get_combined_code(self, values, config):
+    def _get_combined_code(self, values, config, import_context=None):
         if not config.combination_rule_ids:
             return values.get('supplier_product_code')
-    
-        for rule in config.combination_rule_ids:
-            if not rule.field_1 or not rule.field_2 or not rule.combination_pattern:
-                continue
-    
-            field1_value = values.get(rule.field_1.destination_field_name, '')
-            field2_value = values.get(rule.field_2.destination_field_name, '')
-    
-            field1_value = str(field1_value).strip() if field1_value is not None else ''
-            field2_value = str(field2_value).strip() if field2_value is not None else ''
-            
-            if not field1_value or not field2_value:
-                continue
-    
-            if ((not rule.value_1 or field1_value.lower() == rule.value_1.lower()) and 
-                (not rule.value_2 or field2_value.lower() == rule.value_2.lower())):
-                combined = rule.combination_pattern.format(field1_value, field2_value)
-    
-                if rule.regex_pattern:
-                    match = re.search(rule.regex_pattern, combined)
-                    if match:
-                        return match.group(1)
-                else:
-                    return combined
-    
-        return values.get('supplier_product_code')
-    
+
+        rule_matcher = import_context.rule_matcher if import_context else config._get_rule_matcher()
+        combined = rule_matcher.get_combined_code(values)
+        return combined if combined is not None else values.get('supplier_product_code')
+
 class ProductTemplate(models.Model):
     _inherit = 'product.template'
 
@@ -0,0 +1,46 @@
+from datetime import timedelta
+import logging
+
+from odoo import models, fields, api
+
+_logger = logging.getLogger(__name__)
+
+# Days a product info report stays cached after a newer version replaced it
+REPORT_CACHE_RETENTION_DAYS = 7
+
+
+class IrAttachment(models.Model):
+    _inherit = 'ir.attachment'
+
+    product_info_fingerprint = fields.Char(string='Product Info Report Fingerprint', index=True, copy=False,
+                                           help="Fingerprint of the document state a cached product info report was generated from")
+
+    @api.model
+    def _gc_product_info_reports(self):
+        """
+        Delete the cached product info reports replaced by a newer version of
+        the report of the same document for longer than the retention period.
+        The latest report of every document is kept, and so are reports
+        attached to a message, as they are part of the document history.
+        """
+        retention_days = int(self.env['ir.config_parameter'].sudo().get_param(
+            'supplier_information_import.report_cache_retention_days', REPORT_CACHE_RETENTION_DAYS))
+        limit_date = fields.Datetime.now() - timedelta(days=retention_days)
+
+        self.flush_model(['res_model', 'res_id', 'product_info_fingerprint', 'create_date'])
+        self.env.cr.execute("""
+            SELECT id FROM (
+                SELECT a.id, a.create_date,
+                       row_number() OVER (PARTITION BY a.res_model, a.res_id ORDER BY a.id DESC) AS version
+                FROM ir_attachment a
+                WHERE a.product_info_fingerprint IS NOT NULL
+            ) reports
+            WHERE version > 1
+              AND create_date < %s
+              AND NOT EXISTS (SELECT 1 FROM message_attachment_rel rel WHERE rel.attachment_id = reports.id)
+        """, [limit_date])
+        stale_ids = [row[0] for row in self.env.cr.fetchall()]
+        if stale_ids:
+            self.sudo().browse(stale_ids).unlink()
+        _logger.info(f"Deleted {len(stale_ids)} stale product info report attachments")
+        return len(stale_ids)
@@ -0,0 +1,189 @@
+import json
+import logging
+from datetime import timedelta
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+from .utils import show_notification
+
+_logger = logging.getLogger(__name__)
+
+RUNNER_CRON_XMLID = 'supplier_information_import.ir_cron_product_info_report_export'
+# Exports of more documents than this run in the background
+DEFAULT_BACKGROUND_THRESHOLD = 50
+# Days before draft exports, i.e. closed dialogs, are deleted
+DRAFT_EXPORT_DAYS = 1
+# Minutes after which a running export no runner is working on is queued again
+STALE_EXPORT_MINUTES = 15
+
+
+class ProductInfoReportExport(models.Model):
+    _name = 'product.info.report.export'
+    _description = 'Product Info Report Export'
+    _order = 'id desc'
+
+    name = fields.Char(string='Name', compute='_compute_name', store=True)
+    res_model = fields.Selection([
+        ('sale.order', 'Sales Orders'),
+        ('stock.picking', 'Transfers'),
+    ], string='Documents', required=True, readonly=True)
+    res_ids = fields.Text(string='Document IDs', required=True, readonly=True, default='[]')
+    record_count = fields.Integer(string='Number of Documents', compute='_compute_record_count', store=True)
+    export_format = fields.Selection([
+        ('sheets', 'One Workbook, a Sheet per Document'),
+        ('zip', 'Zip Archive, a Workbook per Document'),
+    ], string='Format', required=True, default='sheets')
+    user_id = fields.Many2one('res.users', string='Requested By', default=lambda self: self.env.user, required=True)
+    state = fields.Selection([
+        ('draft', 'Draft'),
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ], string='Status', default='draft', required=True, index=True)
+    date_started = fields.Datetime(string='Started', readonly=True)
+    date_finished = fields.Datetime(string='Finished', readonly=True)
+    attachment_id = fields.Many2one('ir.attachment', string='Attachment', readonly=True, ondelete='set null')
+    file = fields.Binary(related='attachment_id.datas', string='File')
+    file_name = fields.Char(related='attachment_id.name', string='File Name')
+    result_message = fields.Text(string='Result', readonly=True)
+
+    @api.depends('res_model', 'record_count')
+    def _compute_name(self):
+        descriptions = dict(self._fields['res_model']._description_selection(self.env))
+        for export in self:
+            export.name = f"{descriptions.get(export.res_model, '')} ({export.record_count})"
+
+    @api.depends('res_ids')
+    def _compute_record_count(self):
+        for export in self:
+            export.record_count = len(json.loads(export.res_ids or '[]'))
+
+    @api.model
+    def action_open_for_records(self, records):
+        """
+        Open the export dialog for the documents selected in a list view.
+        """
+        if not records:
+            raise UserError(_("Please select the documents to export."))
+        export = self.create({
+            'res_model': records._name,
+            'res_ids': json.dumps(records.ids),
+        })
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _('Export Product Info Reports'),
+            'res_model': self._name,
+            'res_id': export.id,
+            'view_mode': 'form',
+            'views': [(False, 'form')],
+            'target': 'new',
+        }
+
+    @api.model
+    def _get_background_threshold(self):
+        param = self.env['ir.config_parameter'].sudo().get_param(
+            'supplier_information_import.report_export_background_threshold', DEFAULT_BACKGROUND_THRESHOLD)
+        try:
+            return max(0, int(param))
+        except (TypeError, ValueError):
+            return DEFAULT_BACKGROUND_THRESHOLD
+
+    def action_export(self):
+        """
+        Generate the reports right away for small selections and download
+        them, or queue the export for the background runner.
+        """
+        self.ensure_one()
+        if self.record_count > self._get_background_threshold():
+            self.state = 'queued'
+            self.env.ref(RUNNER_CRON_XMLID).sudo()._trigger()
+            return {
+                'type': 'ir.actions.client',
+                'tag': 'display_notification',
+                'params': {
+                    'title': _('Export Queued'),
+                    'message': _("The reports of %s documents are generated in the background. "
+                                 "You will be notified when they are ready.") % self.record_count,
+                    'type': 'info',
+                    'next': {'type': 'ir.actions.act_window_close'},
+                },
+            }
+
+        self._run()
+        if self.state == 'failed':
+            raise UserError(self.result_message)
+        return {
+            'type': 'ir.actions.act_url',
+            'url': f'/web/content/{self.attachment_id.id}?download=true',
+            'target': 'self',
+        }
+
+    def _get_records(self):
+        self.ensure_one()
+        return self.env[self.res_model].browse(json.loads(self.res_ids)).exists()
+
+    def _run(self):
+        self.ensure_one()
+        self.state = 'running'
+        try:
+            with self.env.cr.savepoint():
+                records = self._get_records()
+                extension = 'zip' if self.export_format == 'zip' else 'xlsx'
+                attachment = records._create_batch_report_attachment(self.export_format, {
+                    'name': f"Product_Info_{fields.Date.context_today(self)}.{extension}",
+                    'res_model': self._name,
+                    'res_id': self.id,
+                })
+            self.write({
+                'state': 'done',
+                'date_finished': fields.Datetime.now(),
+                'attachment_id': attachment.id,
+                'result_message': _("Generated the reports of %s documents.") % len(records),
+            })
+        except Exception as e:
+            _logger.error(f"Product info report export {self.id} failed", exc_info=True)
+            self.write({
+                'state': 'failed',
+                'date_finished': fields.Datetime.now(),
+                'result_message': _("Error during report export: {}").format(str(e)),
+            })
+
+    @api.model
+    def _cron_run_exports(self):
+        limit = fields.Datetime.now() - timedelta(days=DRAFT_EXPORT_DAYS)
+        self.search([('state', '=', 'draft'), ('create_date', '<', limit)]).unlink()
+        self._requeue_stale_exports()
+
+        for export in self.search([('state', '=', 'queued')], order='id'):
+            export = export.with_user(export.user_id)
+            export.write({'state': 'running', 'date_started': fields.Datetime.now()})
+            self.env.cr.commit()
+            # Hold the row lock while the export runs, so it is not taken for stale
+            self.env.cr.execute("SELECT id FROM product_info_report_export WHERE id = %s FOR UPDATE", [export.id])
+            export._run()
+            self.env.cr.commit()
+            if export.state == 'done':
+                show_notification(export.env, export.result_message, _('Report Export Finished'), type='success')
+            else:
+                show_notification(export.env, export.result_message, _('Report Export Error'), type='danger')
+
+    @api.model
+    def _requeue_stale_exports(self):
+        """
+        Put running exports back in the queue when their runner stopped, e.g.
+        because it was killed. Exports still locked by a live runner are left
+        alone, however long they run.
+        """
+        limit = fields.Datetime.now() - timedelta(minutes=STALE_EXPORT_MINUTES)
+        self.flush_model(['state', 'date_started'])
+        self.env.cr.execute("""
+            SELECT id FROM product_info_report_export
+             WHERE state = 'running' AND (date_started IS NULL OR date_started < %s)
+               FOR UPDATE SKIP LOCKED
+        """, [limit])
+        stale = self.browse([row[0] for row in self.env.cr.fetchall()])
+        if stale:
+            _logger.warning(f"Requeueing stale product info report exports: {stale.ids}")
+            stale.write({'state': 'queued'})
+            self.env.cr.commit()
@@ -1,12 +1,22 @@
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
 import base64
+import hashlib
+import os
+import re
+import tempfile
+import zipfile
 import xlsxwriter
 from io import BytesIO
 import logging
 
+from .utils import create_attachment_from_file
+
 _logger = logging.getLogger(__name__)
 
+# Report lines whose values are computed together when streaming a report
+REPORT_BATCH_SIZE = 500
+
 class ProductInfoReportMixin(models.AbstractModel):
     _name = 'product.info.report.mixin'
     _description = 'Product Info Report Mixin'
@@ -30,22 +40,23 @@ class ProductInfoReportMixin(models.AbstractModel):
         # This method should be implemented in the inheriting model
         raise NotImplementedError(_("This method must be implemented in the inheriting model"))
 
+    def _get_batch_report_lines(self):
+        """
+        Load the report lines of many documents. Inheriting models override
+        this to load the lines of all documents at once.
+
+        :return: A dict mapping the document ids to their report lines
+        """
+        return {record.id: record._get_report_lines() for record in self}
+
     def action_generate_and_send_excel(self):
         self.ensure_one()
         user_lang = self.env.user.lang
         partner = self.partner_id
         partner_lang = partner.lang or user_lang
 
-        # Generate the Excel report
-        excel_data = self.generate_excel_report()
-        
-        # Create attachment
-        attachment = self.env['ir.attachment'].create({
-            'name': f'Product_Info_{self.name}.xlsx',
-            'datas': excel_data,
-            'res_model': self._name,
-            'res_id': self.id,
-        })
+        # Reuse the report of an unchanged document, or generate and attach it
+        attachment = self._get_excel_report_attachment()
 
         # Determine the correct email template based on the model
         if self._name == 'sale.order':
@@ -88,35 +99,328 @@ class ProductInfoReportMixin(models.AbstractModel):
 
     def generate_excel_report(self):
         self.ensure_one()
-        partner_lang = self._get_partner_lang()
-        
         output = BytesIO()
-        workbook = xlsxwriter.Workbook(output, {'in_memory': True})
-        
-        worksheet = workbook.add_worksheet(self._get_report_worksheet_name())
+        self._write_excel_report(output, {'in_memory': True})
+        return base64.b64encode(output.getvalue())
 
-        # Define headers based on configuration
+    def _get_excel_report_attachment(self):
+        """
+        Return the report attachment of the current state of the document,
+        generating it only when no attachment with the same fingerprint exists.
+
+        :return: The ir.attachment record of the report
+        """
+        self.ensure_one()
+        report_data = self._prepare_report_data()
+        fingerprint = self._get_report_fingerprint(report_data)
+        attachment = self.env['ir.attachment'].search([
+            ('res_model', '=', self._name),
+            ('res_id', '=', self.id),
+            ('product_info_fingerprint', '=', fingerprint),
+        ], order='id desc', limit=1)
+        if attachment:
+            _logger.info(f"Reusing report attachment {attachment.id} of {self._name} {self.id}")
+            return attachment
+        return self._create_excel_report_attachment(report_data, fingerprint)
+
+    def _create_excel_report_attachment(self, report_data=None, fingerprint=False):
+        """
+        Write the report to a temporary file in constant memory mode, where
+        rows are flushed to disk as they are written, and attach the file
+        without loading it in memory.
+
+        :param report_data: The data returned by _prepare_report_data, if already loaded
+        :param fingerprint: The fingerprint of the report, stored on the attachment
+        :return: The created ir.attachment record
+        """
+        self.ensure_one()
+        fd, path = tempfile.mkstemp(prefix='product_info_', suffix='.xlsx')
+        os.close(fd)
+        try:
+            self._write_excel_report(path, {'constant_memory': True, 'tmpdir': tempfile.gettempdir()}, report_data)
+            return create_attachment_from_file(self.env, path, {
+                'name': f'Product_Info_{self.name}.xlsx',
+                'res_model': self._name,
+                'res_id': self.id,
+                'mimetype': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                'product_info_fingerprint': fingerprint,
+            })
+        finally:
+            os.unlink(path)
+
+    def _prepare_report_data(self):
+        """
+        Resolve the columns and the lines of the report, and load the incoming
+        infos of all lines once.
+
+        :return: A dict with the partner language, the report fields, the
+                 report lines and the incoming info index
+        """
+        self.ensure_one()
+        report_fields = self._get_report_fields()
+        report_lines = self._get_report_lines()
+        return {
+            'lang': self._get_partner_lang(),
+            'fields': report_fields,
+            'lines': report_lines,
+            'info_index': self._get_incoming_info_index(report_lines, report_fields),
+        }
+
+    def _get_report_fingerprint(self, report_data):
+        """
+        Hash everything the report is built from: the document, its lines and
+        move lines, the products, the incoming infos, the report field
+        configuration and the language. Any change to one of them, including
+        translated labels, changes a write date and so the fingerprint.
+
+        :param report_data: The data returned by _prepare_report_data
+        :return: The hex digest of the fingerprint
+        """
+        config = self.env['import.format.config'].search([], limit=1)
+        parts = [
+            self._name, self.id, report_data['lang'],
+            config.id, str(config.write_date), config.report_worksheet_name,
+        ]
+        for report_field in config.report_field_ids.sorted(key=lambda r: r.sequence):
+            parts += [report_field.id, str(report_field.write_date), report_field.field_id.id]
+        for line, move_line in report_data['lines']:
+            parts += [line._name, line.id, str(line.write_date),
+                      line.product_id.id, str(line.product_id.write_date),
+                      str(line.product_id.product_tmpl_id.write_date)]
+            if move_line:
+                parts += [move_line.id, str(move_line.write_date)]
+            else:
+                parts.append(0)
+        for info in sorted(report_data['info_index'].values(), key=lambda r: r.id):
+            parts += [info.id, str(info.write_date)]
+        return hashlib.sha1('\x1f'.join(str(part) for part in parts).encode()).hexdigest()
+
+    def _write_excel_report(self, output, options, report_data=None):
+        """
+        Write the report workbook.
+
+        :param output: A file path or a binary file object to write to
+        :param options: The xlsxwriter.Workbook options. Rows are written in
+                        order, so they can be written in constant_memory mode.
+        :param report_data: The data returned by _prepare_report_data, if already loaded
+        """
+        self.ensure_one()
+        if report_data is None:
+            report_data = self._prepare_report_data()
+        partner_lang = report_data['lang']
+
+        workbook = xlsxwriter.Workbook(output, options)
         headers = self._get_report_headers(lang=partner_lang)
+        self._write_report_worksheet(workbook, self._get_report_worksheet_name(), headers, report_data)
+        workbook.close()
+
+    def _write_report_worksheet(self, workbook, sheet_name, headers, report_data):
+        """
+        Add a worksheet with the report of the document to a workbook.
+
+        :param headers: The column headers, in the language of the report
+        :param report_data: The data returned by _prepare_report_data
+        """
+        self.ensure_one()
+        partner_lang = report_data['lang']
+        report_fields = report_data['fields']
+        info_index = report_data['info_index']
+
+        worksheet = workbook.add_worksheet(sheet_name)
+
+        # Define headers based on configuration
         for col, header in enumerate(headers):
             worksheet.write(0, col, header)
 
         # Collect and write data
         row = 1
-        for line, move_line in self._get_report_lines():
+        for line, move_line in report_data['lines']:
             col = 0
-            for field in self._get_report_fields():
-                value = self._get_field_value(line, move_line, field, lang=partner_lang)
+            for field in report_fields:
+                value = self._get_field_value(line, move_line, field, lang=partner_lang, info_index=info_index)
                 worksheet.write(row, col, value if value else '')
                 col += 1
             row += 1
 
+    def _prepare_batch_report_data(self):
+        """
+        Prepare the report data of many documents at once: the report fields
+        are resolved once, and the report lines and the incoming infos of the
+        lines of all documents are each loaded with one search.
+
+        :return: A dict mapping the document ids to their report data, as
+                 returned by _prepare_report_data
+        """
+        report_fields = self._get_report_fields()
+        lines_by_record = self._get_batch_report_lines()
+        all_lines = [line for lines in lines_by_record.values() for line in lines]
+        info_index = self._get_incoming_info_index(all_lines, report_fields)
+        return {
+            record.id: {
+                'lang': record._get_partner_lang(),
+                'fields': report_fields,
+                'lines': lines_by_record[record.id],
+                'info_index': info_index,
+            }
+            for record in self
+        }
+
+    def _write_batch_excel_report(self, output, options, batch_data=None):
+        """
+        Write the reports of many documents to one workbook, one worksheet
+        per document named after it.
+
+        :param batch_data: The data returned by _prepare_batch_report_data, if already loaded
+        """
+        if batch_data is None:
+            batch_data = self._prepare_batch_report_data()
+        workbook = xlsxwriter.Workbook(output, options)
+        headers_by_lang = {}
+        sheet_names = set()
+        for record in self:
+            report_data = batch_data[record.id]
+            lang = report_data['lang']
+            if lang not in headers_by_lang:
+                headers_by_lang[lang] = record._get_report_headers(lang=lang)
+            sheet_name = self._get_unique_name(record.name, sheet_names, max_length=31)
+            record._write_report_worksheet(workbook, sheet_name, headers_by_lang[lang], report_data)
         workbook.close()
-        excel_data = output.getvalue()
-        return base64.b64encode(excel_data)
 
-    def _get_field_value(self, line, move_line, field_config, lang):
+    @api.model
+    def _get_unique_name(self, name, used_names, max_length=None):
+        """
+        Make a name usable as worksheet or file name, and unique among
+        used_names, ignoring case. The name is added to used_names.
+        """
+        name = re.sub(r'[\[\]:*?/\\]', '-', name or _('Report')).strip("'")
+        if max_length:
+            name = name[:max_length]
+        unique_name = name
+        suffix = 1
+        while unique_name.lower() in used_names:
+            suffix += 1
+            tail = f' ({suffix})'
+            unique_name = (name[:max_length - len(tail)] if max_length else name) + tail
+        used_names.add(unique_name.lower())
+        return unique_name
+
+    def _create_batch_report_attachment(self, export_format, vals):
+        """
+        Generate the reports of many documents in one pass and attach them,
+        either as one workbook with a worksheet per document or as a zip
+        archive of one workbook per document. Workbooks are written in
+        constant memory mode to temporary files.
+
+        :param export_format: 'sheets' or 'zip'
+        :param vals: The values of the attachment, e.g. its res_model and res_id
+        :return: The created ir.attachment record
+        """
+        batch_data = self._prepare_batch_report_data()
+        tmpdir = tempfile.gettempdir()
+        options = {'constant_memory': True, 'tmpdir': tmpdir}
+        suffix = '.zip' if export_format == 'zip' else '.xlsx'
+        fd, path = tempfile.mkstemp(prefix='product_info_batch_', suffix=suffix)
+        os.close(fd)
+        try:
+            if export_format == 'zip':
+                file_names = set()
+                with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+                    for record in self:
+                        fd, report_path = tempfile.mkstemp(prefix='product_info_', suffix='.xlsx')
+                        os.close(fd)
+                        try:
+                            record._write_excel_report(report_path, options, batch_data[record.id])
+                            file_name = self._get_unique_name(f'Product_Info_{record.name}', file_names)
+                            archive.write(report_path, f'{file_name}.xlsx')
+                        finally:
+                            os.unlink(report_path)
+                mimetype = 'application/zip'
+            else:
+                self._write_batch_excel_report(path, options, batch_data)
+                mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+            _logger.info(f"Generated the product info reports of {len(self)} {self._name} records")
+            return create_attachment_from_file(self.env, path, dict(vals, mimetype=mimetype))
+        finally:
+            os.unlink(path)
+
+    def _get_report_column_keys(self):
+        """
+        :return: The keys of the report columns for structured exports: the
+                 field names, prefixed with their model when two columns
+                 share a field name
+        """
+        report_fields = self._get_report_fields()
+        names = [field.name for field in report_fields]
+        return [field.name if names.count(field.name) == 1 else f'{field.model}.{field.name}'
+                for field in report_fields]
+
+    def _iter_report_line_batches(self, batch_size=REPORT_BATCH_SIZE):
+        """
+        Yield the report lines in batches. Models whose lines are single
+        database rows can read them with a server-side cursor instead.
+        """
+        self.ensure_one()
+        report_lines = self._get_report_lines()
+        for start in range(0, len(report_lines), batch_size):
+            yield report_lines[start:start + batch_size]
+
+    def _iter_report_rows(self, batch_size=REPORT_BATCH_SIZE):
+        """
+        Yield the rows of the report as lists of values, in the order of the
+        report fields. The values of a batch of lines are computed together,
+        so the first rows can be sent before the later ones are computed, and
+        the cache is cleared after each batch to keep the memory flat.
+        """
+        self.ensure_one()
+        partner_lang = self._get_partner_lang()
+        report_fields = self._get_report_fields()
+        for report_lines in self._iter_report_line_batches(batch_size):
+            info_index = self._get_incoming_info_index(report_lines, report_fields)
+            for line, move_line in report_lines:
+                yield [self._get_field_value(line, move_line, field, lang=partner_lang, info_index=info_index)
+                       for field in report_fields]
+            self.env.invalidate_all()
+
+    def _get_incoming_info_index(self, report_lines, report_fields):
+        """
+        Load the incoming product infos of all report lines with one search.
+
+        :return: A dict mapping (sn, product template id) to the first
+                 incoming.product.info of that serial number for the template,
+                 which is also the first one matching the product variant
+        """
+        if 'incoming.product.info' not in report_fields.mapped('model'):
+            return {}
+        sns = set()
+        template_ids = set()
+        for line, move_line in report_lines:
+            if move_line and move_line.lot_id:
+                sns.add(move_line.lot_id.name)
+                template_ids.add(line.product_id.product_tmpl_id.id)
+        if not sns:
+            return {}
+
+        infos = self.env['incoming.product.info'].search([
+            ('sn', 'in', list(sns)),
+            ('product_id.product_tmpl_id', 'in', list(template_ids)),
+        ], order='id')
+        info_index = {}
+        for info in infos:
+            info_index.setdefault((info.sn, info.product_id.product_tmpl_id.id), info)
+        _logger.info(f"Loaded {len(infos)} incoming infos for {len(report_lines)} report lines")
+        return info_index
+
+    def _get_field_value(self, line, move_line, field_config, lang, info_index=None):
         self = self.with_context(lang=lang)
         
+        if field_config.model == 'incoming.product.info' and info_index is not None:
+            sn = move_line.lot_id.name if move_line and move_line.lot_id else False
+            incoming_info = info_index.get((sn, line.product_id.product_tmpl_id.id))
+            if not incoming_info:
+                return ''
+            value = getattr(incoming_info, field_config.name.lower(), '')
+            return value if value not in [False, 'False'] else ''
+
         if field_config.model == 'incoming.product.info':
             product = line.product_id
             sn = move_line.lot_id.name if move_line and move_line.lot_id else False
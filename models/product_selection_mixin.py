@@ -23,14 +23,14 @@ class ProductSelectionMixin(models.AbstractModel):
         self.ensure_one()
         if self.product_id:
             IncomingProductInfo = self.env['incoming.product.info']
-            for _ in range(getattr(self, 'count', 1)):
-                incoming_product = IncomingProductInfo.create({
-                    'supplier_id': self.supplier_id.id,
-                    'product_id': self.product_id.id,
-                    'model_no': getattr(self, 'model_no', False),
-                    'sn': getattr(self, 'pn', False) or getattr(self, 'sn', False),
-                    'supplier_product_code': getattr(self, 'supplier_product_code', False) or getattr(self, 'product_code', False),
-                })
+            # Serial numbers are unique per supplier, so link a single record
+            incoming_product, is_new = IncomingProductInfo.find_or_create({
+                'supplier_id': self.supplier_id.id,
+                'product_id': self.product_id.id,
+                'model_no': getattr(self, 'model_no', False),
+                'sn': getattr(self, 'pn', False) or getattr(self, 'sn', False),
+                'supplier_product_code': getattr(self, 'supplier_product_code', False) or getattr(self, 'product_code', False),
+            })
             
             supplierinfo = self.env['product.supplierinfo'].search([
                 ('partner_id', '=', self.supplier_id.id),
@@ -0,0 +1,181 @@
+import logging
+import re
+from collections import deque, namedtuple
+
+_logger = logging.getLogger(__name__)
+
+# Stands in for invalid regex patterns, so their rule never applies
+NEVER_MATCH = re.compile(r'(?!)')
+
+CompiledRule = namedtuple('CompiledRule', [
+    'position', 'id', 'name', 'product_id', 'field_1', 'field_2', 'value_1', 'value_2',
+    'combination_pattern', 'regex',
+])
+
+
+class SubstringAutomaton:
+    """
+    Aho-Corasick automaton telling which of a set of patterns occur in a
+    text, in a single pass over the text whatever the number of patterns.
+    """
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [set()]
+        # The empty pattern occurs in every text
+        self.always = set()
+
+        for pattern in patterns:
+            if not pattern:
+                self.always.add(pattern)
+                continue
+            node = 0
+            for char in pattern:
+                child = self.goto[node].get(char)
+                if child is None:
+                    child = len(self.goto)
+                    self.goto[node][char] = child
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(set())
+                node = child
+            self.output[node].add(pattern)
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                state = self.fail[node]
+                while state and char not in self.goto[state]:
+                    state = self.fail[state]
+                self.fail[child] = self.goto[state].get(char, 0)
+                self.output[child] |= self.output[self.fail[child]]
+
+    def find(self, text):
+        """
+        :return: The set of patterns occurring in text
+        """
+        found = set(self.always)
+        goto, fail, output = self.goto, self.fail, self.output
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                found |= output[node]
+        return found
+
+
+class CombinationRuleMatcher:
+    """
+    The combination rules of an import configuration compiled for matching
+    many rows: values are lowercased and regexes compiled once, and the rules
+    are indexed per pair of fields so a row is only tested against the rules
+    whose values it can match. Matches are returned in rule order, so the
+    first match still wins.
+    """
+
+    def __init__(self, rules):
+        """
+        :param rules: The import.combination.rule records, in matching order
+        """
+        self.rules = []
+        for position, rule in enumerate(rules):
+            regex = None
+            if rule.regex_pattern:
+                try:
+                    regex = re.compile(rule.regex_pattern)
+                except re.error as e:
+                    _logger.warning(f"Invalid regex pattern on rule {rule.name}: {e}")
+                    regex = NEVER_MATCH
+            self.rules.append(CompiledRule(
+                position=position,
+                id=rule.id,
+                name=rule.name,
+                product_id=rule.product_id.id,
+                field_1=rule.field_1.destination_field_name,
+                field_2=rule.field_2.destination_field_name,
+                value_1=(rule.value_1 or '').lower(),
+                value_2=(rule.value_2 or '').lower(),
+                combination_pattern=rule.combination_pattern,
+                regex=regex,
+            ))
+
+        # Substring index: (field_1, field_2) -> (automaton and positions per value_1,
+        # automaton and positions per value_2)
+        self._substring_index = {}
+        # Equality index: (field_1, field_2) -> (positions per value_1, positions per value_2),
+        # keyed on None for rules without a value
+        self._equality_index = {}
+        for rule in self.rules:
+            positions_1, positions_2 = self._substring_index.setdefault((rule.field_1, rule.field_2), ({}, {}))
+            positions_1.setdefault(rule.value_1, set()).add(rule.position)
+            positions_2.setdefault(rule.value_2, set()).add(rule.position)
+
+            if rule.field_1 and rule.field_2 and rule.combination_pattern:
+                equal_1, equal_2 = self._equality_index.setdefault((rule.field_1, rule.field_2), ({}, {}))
+                equal_1.setdefault(rule.value_1 or None, set()).add(rule.position)
+                equal_2.setdefault(rule.value_2 or None, set()).add(rule.position)
+
+        self._substring_index = {
+            fields: (SubstringAutomaton(positions_1), positions_1, SubstringAutomaton(positions_2), positions_2)
+            for fields, (positions_1, positions_2) in self._substring_index.items()
+        }
+
+    @staticmethod
+    def _get_value(values, field_name):
+        value = values.get(field_name, '') if field_name else ''
+        return str(value).strip() if value is not None else ''
+
+    def match(self, values):
+        """
+        Find the rules whose value_1 and value_2 occur in the values of their
+        fields, ignoring case.
+
+        :param values: The mapped values of a row
+        :return: The matching CompiledRule tuples, in rule order
+        """
+        positions = set()
+        for (field_1, field_2), (automaton_1, positions_1, automaton_2, positions_2) in self._substring_index.items():
+            found_1 = automaton_1.find(self._get_value(values, field_1).lower())
+            if not found_1:
+                continue
+            found_2 = automaton_2.find(self._get_value(values, field_2).lower())
+            if not found_2:
+                continue
+            matched_1 = set().union(*(positions_1[value] for value in found_1))
+            matched_2 = set().union(*(positions_2[value] for value in found_2))
+            positions |= matched_1 & matched_2
+        return [self.rules[position] for position in sorted(positions)]
+
+    def get_combined_code(self, values):
+        """
+        Combine the values of the first rule whose value_1 and value_2 equal
+        the values of its fields, ignoring case, with its combination
+        pattern, and extract the first group of its regex when it has one.
+
+        :return: The combined code, or None when no rule applies
+        """
+        positions = set()
+        for (field_1, field_2), (equal_1, equal_2) in self._equality_index.items():
+            value_1 = self._get_value(values, field_1)
+            value_2 = self._get_value(values, field_2)
+            if not value_1 or not value_2:
+                continue
+            matched_1 = equal_1.get(value_1.lower(), set()) | equal_1.get(None, set())
+            matched_2 = equal_2.get(value_2.lower(), set()) | equal_2.get(None, set())
+            positions |= matched_1 & matched_2
+
+        for position in sorted(positions):
+            rule = self.rules[position]
+            combined = rule.combination_pattern.format(
+                self._get_value(values, rule.field_1), self._get_value(values, rule.field_2))
+            if not rule.regex:
+                return combined
+            match = rule.regex.search(combined)
+            if match:
+                return match.group(1)
+        return None
@@ -9,17 +9,87 @@ class SaleOrder(models.Model):
     _inherit = ['sale.order','product.info.report.mixin']
 
     def _get_report_lines(self):
+        """
+        Pair the serial tracked order lines with their done move lines. A move
+        line goes to the order line of its move, and move lines whose move is
+        not linked to an order line of this order go to the first order line
+        of their product without linked move lines, or else to the first order
+        line of their product.
+
+        :return: A list of (sale.order.line, stock.move.line or False) tuples
+        """
+        self.ensure_one()
+        return self._get_batch_report_lines()[self.id]
+
+    def _get_batch_report_lines(self):
+        """
+        Pair the order lines and move lines of many orders at once: the done
+        move lines of all their transfers are loaded with one search and
+        paired per order as in _get_report_lines.
+        """
+        order_lines = self.order_line.filtered(lambda l: l.product_id.tracking == 'serial')
+        order_ids_by_picking = {}
+        for order in self:
+            for picking in order.picking_ids:
+                order_ids_by_picking.setdefault(picking.id, set()).add(order.id)
+
+        move_lines_by_order = {order.id: [] for order in self}
+        if order_lines and order_ids_by_picking:
+            # Load the done move lines of all serial tracked products at once
+            move_lines = self.env['stock.move.line'].search([
+                ('picking_id', 'in', list(order_ids_by_picking)),
+                ('product_id', 'in', order_lines.product_id.ids),
+                ('state', '=', 'done'),
+            ], order='id')
+            for move_line in move_lines:
+                for order_id in order_ids_by_picking[move_line.picking_id.id]:
+                    move_lines_by_order[order_id].append(move_line)
+
+        order_line_ids_by_order = {order.id: [] for order in self}
+        for line in order_lines:
+            order_line_ids_by_order[line.order_id.id].append(line.id)
+        return {
+            order.id: order._pair_report_lines(
+                self.env['sale.order.line'].browse(order_line_ids_by_order[order.id]), move_lines_by_order[order.id])
+            for order in self
+        }
+
+    def _pair_report_lines(self, order_lines, move_lines):
+        """
+        Pair serial tracked order lines of the order with the done move lines
+        of its transfers, see _get_report_lines.
+        """
         self.ensure_one()
+        product_ids = set(order_lines.product_id.ids)
+        move_lines = [move_line for move_line in move_lines if move_line.product_id.id in product_ids]
+        if not move_lines:
+            return [(line, False) for line in order_lines]
+
+        move_lines_by_line = {line.id: [] for line in order_lines}
+        unlinked_by_product = {}
+        for move_line in move_lines:
+            sale_line_id = move_line.move_id.sale_line_id.id
+            if sale_line_id in move_lines_by_line:
+                move_lines_by_line[sale_line_id].append(move_line)
+            else:
+                unlinked_by_product.setdefault(move_line.product_id.id, []).append(move_line)
+
+        for line in order_lines:
+            if not move_lines_by_line[line.id] and line.product_id.id in unlinked_by_product:
+                move_lines_by_line[line.id] = unlinked_by_product.pop(line.product_id.id)
+        # Every order line of the product already has its own move lines
+        for line in order_lines:
+            if line.product_id.id in unlinked_by_product:
+                move_lines_by_line[line.id] += unlinked_by_product.pop(line.product_id.id)
+
         lines = []
-        for line in self.order_line.filtered(lambda l: l.product_id.tracking == 'serial'):
-            move_lines = self.picking_ids.mapped('move_line_ids').filtered(
-                lambda ml: ml.product_id == line.product_id and ml.state == 'done'
-            )
-            if move_lines:
-                for move_line in move_lines:
+        for line in order_lines:
+            if move_lines_by_line[line.id]:
+                for move_line in move_lines_by_line[line.id]:
                     lines.append((line, move_line))
             else:
                 lines.append((line, False))
+        _logger.info(f"Paired {len(move_lines)} move lines with {len(order_lines)} lines of order {self.name}")
         return lines
 
     def _get_partner_lang(self):
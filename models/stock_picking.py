@@ -1,6 +1,12 @@
 from odoo import models, _
 from odoo.exceptions import UserError
 import base64
+import logging
+from collections import Counter
+
+from .product_info_report_mixin import REPORT_BATCH_SIZE
+
+_logger = logging.getLogger(__name__)
 
 class StockPicking(models.Model):
     _name = 'stock.picking'
@@ -9,51 +15,66 @@ class StockPicking(models.Model):
     def action_set_quantities_from_pending(self):
         IncomingProductInfo = self.env['incoming.product.info']
         StockMoveLine = self.env['stock.move.line']
+        StockLot = self.env['stock.lot']
 
         for picking in self:
             if picking.picking_type_code != 'incoming':
                 raise UserError(_("This action is only available for incoming transfers."))
 
+            # Pending serial numbers go to the first move of their product
+            moves_by_product = {}
+            for move in picking.move_ids:
+                moves_by_product.setdefault(move.product_id.id, move)
+
             pending_products = IncomingProductInfo.search([
                 ('state', '=', 'pending'),
                 ('stock_picking_id', '=', False),
-                ('supplier_id', '=', picking.partner_id.id)
+                ('supplier_id', '=', picking.partner_id.id),
+                ('product_id', 'in', list(moves_by_product)),
             ])
 
-            products_added = []
-            for move in picking.move_ids:
-                pending = pending_products.filtered(lambda p: p.product_id.id == move.product_id.id)
-                
-                for p in pending:
-                    # Check if there's a matching lot (serial number) for this product
-                    matching_lot = self.env['stock.production.lot'].search([
-                        ('name', '=', p.sn),
-                        ('product_id', '=', p.product_id.id)
-                    ], limit=1)
-
-                    if matching_lot:
-                        move_line = StockMoveLine.create({
-                            'move_id': move.id,
-                            'product_id': p.product_id.id,
-                            'product_uom_id': p.product_id.uom_id.id,
-                            'location_id': move.location_id.id,
-                            'location_dest_id': move.location_dest_id.id,
-                            'picking_id': picking.id,
-                            'lot_id': matching_lot.id,
-                            'qty_done': 1,
-                        })
-
-                        p.write({
-                            'state': 'received',
-                            'stock_picking_id': picking.id
-                        })
-                        
-                        products_added.append(p.product_id.name)
-                    else:
-                        _logger.warning(f"No matching lot found for product {p.product_id.name} with SN {p.sn}")
+            # Load the lots of all pending serial numbers at once
+            lots = StockLot.search([
+                ('name', 'in', list(set(pending_products.mapped('sn')))),
+                ('product_id', 'in', list(moves_by_product)),
+            ])
+            lot_by_key = {}
+            for lot in lots:
+                lot_by_key.setdefault((lot.name, lot.product_id.id), lot)
+
+            move_line_vals = []
+            received_ids = []
+            products_added = Counter()
+            for p in pending_products:
+                # Check if there's a matching lot (serial number) for this product
+                matching_lot = lot_by_key.get((p.sn, p.product_id.id))
+                if not matching_lot:
+                    _logger.warning(f"No matching lot found for product {p.product_id.name} with SN {p.sn}")
+                    continue
+
+                move = moves_by_product[p.product_id.id]
+                move_line_vals.append({
+                    'move_id': move.id,
+                    'product_id': p.product_id.id,
+                    'product_uom_id': p.product_id.uom_id.id,
+                    'location_id': move.location_id.id,
+                    'location_dest_id': move.location_dest_id.id,
+                    'picking_id': picking.id,
+                    'lot_id': matching_lot.id,
+                    'qty_done': 1,
+                })
+                received_ids.append(p.id)
+                products_added[p.product_id.display_name] += 1
+
+            StockMoveLine.create(move_line_vals)
+            IncomingProductInfo.browse(received_ids).write({
+                'state': 'received',
+                'stock_picking_id': picking.id
+            })
 
             if products_added:
-                message = _("Added quantities for the following products: %s") % ", ".join(products_added)
+                message = _("Added quantities for the following products: %s") % ", ".join(
+                    f"{name} ({count})" for name, count in products_added.items())
             else:
                 message = _("No pending products found matching the transfer lines.")
             
@@ -71,4 +92,48 @@ class StockPicking(models.Model):
         for move_line in self.move_line_ids.filtered(lambda ml: ml.product_id.tracking == 'serial'):
             sale_line = move_line.move_id.sale_line_id
             lines.append((sale_line or move_line, move_line))
-        return lines
\ No newline at end of file
+        return lines
+
+    def _get_batch_report_lines(self):
+        """
+        Load the serial tracked move lines of many transfers with one search
+        and group them per transfer.
+        """
+        lines_by_picking = {picking.id: [] for picking in self}
+        move_lines = self.env['stock.move.line'].search([
+            ('picking_id', 'in', self.ids),
+            ('product_id.tracking', '=', 'serial'),
+        ])
+        for move_line in move_lines:
+            sale_line = move_line.move_id.sale_line_id
+            lines_by_picking[move_line.picking_id.id].append((sale_line or move_line, move_line))
+        return lines_by_picking
+
+    def _iter_report_line_batches(self, batch_size=REPORT_BATCH_SIZE):
+        """
+        Read the serial tracked move lines of the transfer with a server-side
+        cursor, batch_size rows at a time, so the first lines are reported
+        before the later ones are read.
+        """
+        self.ensure_one()
+        self.env['stock.move.line'].flush_model(['picking_id', 'product_id'])
+        self.env['product.template'].flush_model(['tracking'])
+        cursor = self.env.cr._cnx.cursor(f'product_info_report_{self.id}')
+        try:
+            cursor.itersize = batch_size
+            cursor.execute("""
+                SELECT ml.id
+                  FROM stock_move_line ml
+                  JOIN product_product pp ON pp.id = ml.product_id
+                  JOIN product_template pt ON pt.id = pp.product_tmpl_id
+                 WHERE ml.picking_id = %s AND pt.tracking = 'serial'
+                 ORDER BY ml.id
+            """, [self.id])
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                move_lines = self.env['stock.move.line'].browse([row[0] for row in rows])
+                yield [(move_line.move_id.sale_line_id or move_line, move_line) for move_line in move_lines]
+        finally:
+            cursor.close()
\ No newline at end of file
@@ -1,6 +1,11 @@
-from odoo import models, fields, api, _
+import json
+import logging
+
+from odoo import models, fields, api
 from .product_selection_mixin import ProductSelectionMixin
 
+_logger = logging.getLogger(__name__)
+
 class UnmatchedModelNo(models.Model, ProductSelectionMixin):
     _name = 'unmatched.model.no'
     _inherit = 'product.selection.mixin'
@@ -16,11 +21,16 @@ class UnmatchedModelNo(models.Model, ProductSelectionMixin):
     supplier_product_code = fields.Char(string='Supplier Product Code')
     product_id = fields.Many2one('product.product', string='Product Variant')
     count = fields.Integer(string='Count', default=1)
-    raw_data = fields.Text(string='Raw Data')
+    line_ids = fields.One2many('unmatched.model.no.line', 'unmatched_id', string='Unmatched Rows')
     sequence = fields.Integer(string='Sequence', default=10)
 
     product_selection = fields.Selection(selection='_get_product_codes', string='Product Selection')
 
+    _sql_constraints = [
+        ('config_model_no_uniq', 'unique(config_id, model_no_lower)',
+         'A model number can only be unmatched once per configuration.'),
+    ]
+
     def name_get(self):
         result = []
         for record in self:
@@ -64,28 +74,124 @@ class UnmatchedModelNo(models.Model, ProductSelectionMixin):
 
     @api.model
     def _add_to_unmatched_models(self, values, config):
-        model_no = values.get('model_no')
+        self._add_rows([values], config)
+
+    @api.model
+    def _add_rows(self, values_list, config):
+        """
+        Add a batch of unmatched rows of an import.
+
+        Rows are grouped per case-insensitive model number in memory, the
+        missing unmatched models are created at once, the rows are inserted
+        in their line table with one INSERT and the counts are increased by
+        the number of rows actually added. A row already stored for a model,
+        by serial number and supplier product code, is not added again.
+        Missing unmatched models are inserted on their unique key, so
+        parallel imports of the same configuration never duplicate them.
+
+        :param values_list: A list of mapped row values without a product
+        :param config: The import.format.config of the import
+        :return: The number of rows added
+        """
+        groups = {}
+        for values in values_list:
+            model_no = values.get('model_no', '')
+            group = groups.setdefault(model_no.strip().lower(), {'model_nos': [], 'rows': {}, 'first': values})
+            if model_no not in group['model_nos']:
+                group['model_nos'].append(model_no)
+            row_key = f"{values.get('sn', '')}-{values.get('supplier_product_code', '')}"
+            group['rows'].setdefault(row_key, values)
+        if not groups:
+            return 0
+
         existing = self.search([
             ('config_id', '=', config.id),
-            ('model_no', '=', model_no)
-        ], limit=1)
-    
-        if existing:
-            existing.write({
-                'count': existing.count + 1,
-                'raw_data': f"{existing.raw_data}\n{str(values)}"
-            })
-        else:
-            self.create({
-                'config_id': config.id,
-                'supplier_id': config.supplier_id.id,
-                'model_no': model_no,
-                'pn': values.get('pn'),
-                'product_code': values.get('supplier_product_code') or values.get('product_code') or model_no,
-                'supplier_product_code': values.get('supplier_product_code') or model_no,
-                'raw_data': str(values),
-                'count': 1
-            })
+            ('model_no_lower', 'in', list(groups)),
+        ])
+        records = {}
+        for record in existing:
+            records.setdefault(record.model_no_lower, record)
+
+        missing = [model_no_lower for model_no_lower in groups if model_no_lower not in records]
+        if missing:
+            # Parallel imports may add the same model number at the same time,
+            # the unique (config_id, model_no_lower) key makes them share one.
+            # The no-op update returns the id of a conflicting record, and
+            # fails with a retried serialization error when that record was
+            # committed by another import after this transaction started.
+            columns = ['config_id', 'supplier_id', 'model_no', 'model_no_lower', 'pn', 'product_code',
+                       'supplier_product_code', 'count', 'sequence']
+            params = []
+            for model_no_lower in missing:
+                values = groups[model_no_lower]['first']
+                model_no = groups[model_no_lower]['model_nos'][0]
+                params.append((
+                    config.id,
+                    config.supplier_id.id or None,
+                    model_no,
+                    model_no_lower,
+                    values.get('pn', ''),
+                    values.get('supplier_product_code') or values.get('product_code') or model_no,
+                    values.get('supplier_product_code') or model_no,
+                    # Not the field default of 1: the count is increased by the rows added below
+                    0,
+                    10,
+                ))
+            self.flush_model()
+            self.env.cr.execute(f"""
+                INSERT INTO unmatched_model_no ({', '.join(columns)}, create_uid, create_date, write_uid, write_date)
+                SELECT v.config_id::int, v.supplier_id::int, v.model_no, v.model_no_lower, v.pn, v.product_code,
+                       v.supplier_product_code, v.count, v.sequence,
+                       %s, now() at time zone 'UTC', %s, now() at time zone 'UTC'
+                  FROM (VALUES {', '.join(['%s'] * len(params))}) AS v({', '.join(columns)})
+                ON CONFLICT (config_id, model_no_lower)
+                DO UPDATE SET model_no_lower = EXCLUDED.model_no_lower
+                RETURNING id, model_no_lower, (xmax = 0) AS inserted
+            """, [self.env.uid, self.env.uid] + params)
+            for record_id, model_no_lower, inserted in self.env.cr.fetchall():
+                records[model_no_lower] = self.browse(record_id)
+                if inserted:
+                    _logger.info(f"Added new unmatched model: {model_no_lower}")
+            self.browse([records[model_no_lower].id for model_no_lower in missing]).invalidate_recordset()
+
+        # Other casings of a model number are listed on it, once per batch
+        for model_no_lower, group in groups.items():
+            record = records[model_no_lower]
+            variants = record.model_no.split(' / ')
+            new_variants = [model_no for model_no in group['model_nos'] if model_no not in variants]
+            if new_variants:
+                record.model_no = ' / '.join(variants + new_variants)
+
+        unmatched_ids, row_keys, sns, data = [], [], [], []
+        for model_no_lower, group in groups.items():
+            for row_key, values in group['rows'].items():
+                unmatched_ids.append(records[model_no_lower].id)
+                row_keys.append(row_key)
+                sns.append(values.get('sn') or None)
+                data.append(json.dumps(values, default=str))
+
+        self.flush_model()
+        self.env.cr.execute("""
+            INSERT INTO unmatched_model_no_line (unmatched_id, row_key, sn, data)
+            SELECT * FROM unnest(%s::int[], %s::varchar[], %s::varchar[], %s::text[])
+            ON CONFLICT (unmatched_id, row_key) DO NOTHING
+            RETURNING unmatched_id
+        """, (unmatched_ids, row_keys, sns, data))
+        added = {}
+        for unmatched_id, in self.env.cr.fetchall():
+            added[unmatched_id] = added.get(unmatched_id, 0) + 1
+
+        if added:
+            self.env.cr.execute("""
+                UPDATE unmatched_model_no unmatched
+                   SET count = COALESCE(unmatched.count, 0) + added.count,
+                       write_uid = %s, write_date = (now() at time zone 'UTC')
+                  FROM unnest(%s::int[], %s::int[]) AS added(id, count)
+                 WHERE unmatched.id = added.id
+            """, (self.env.uid, list(added), list(added.values())))
+            self.browse(list(added)).invalidate_recordset(['count', 'line_ids', 'write_uid', 'write_date'])
+            self.env['unmatched.model.no.line'].invalidate_model()
+        return sum(added.values())
 
     @api.model
     def sort_records(self, config_id):
@@ -95,4 +201,19 @@ class UnmatchedModelNo(models.Model, ProductSelectionMixin):
                 record.sequence = i
         except Exception as e:
             _logger.error(f"Error sorting unmatched model records: {str(e)}")
-            # Don't raise the exception, just log it
\ No newline at end of file
+            # Don't raise the exception, just log it
+
+
+class UnmatchedModelNoLine(models.Model):
+    _name = 'unmatched.model.no.line'
+    _description = 'Unmatched Model Number Row'
+    _log_access = False
+
+    unmatched_id = fields.Many2one('unmatched.model.no', string='Unmatched Model Number', required=True, ondelete='cascade')
+    row_key = fields.Char(string='Row Key', required=True)
+    sn = fields.Char(string='Serial Number')
+    data = fields.Text(string='Row Data')
+
+    _sql_constraints = [
+        ('unmatched_row_key_uniq', 'unique(unmatched_id, row_key)', 'A row is only stored once per unmatched model number.'),
+    ]
@@ -1,6 +1,15 @@
 import base64
 import csv
+import hashlib
 import io
+import mimetypes
+import os
+import posixpath
+import shutil
+import sqlite3
+import tempfile
+import zipfile
+from xml.etree import ElementTree
 import xlrd
 from odoo import _
 import logging
@@ -8,17 +17,152 @@ from odoo.exceptions import UserError
 
 _logger = logging.getLogger(__name__)
 
-def process_csv(file_content, chunk_size=1000):
+CSV_SNIFF_SIZE = 8192
+CSV_DELIMITERS = ';,\t|'
+CSV_DEFAULT_DELIMITER = ';'
+CSV_ENCODING = 'utf-8-sig'
+# Shared strings of an .xlsx file kept in memory before they move to a file on disk
+SHARED_STRINGS_MEMORY_LIMIT = 200000
+SQLITE_BATCH_SIZE = 500
+
+def open_binary_field(record, field_name):
+    """
+    Open the attachment behind a binary field as a binary file object.
+
+    Files in the filestore are opened directly, so they can be read
+    incrementally instead of being loaded and base64-decoded in memory.
+
+    :param record: The record holding the binary field
+    :param field_name: The name of the binary field
+    :return: A binary file object, or None when the field is empty
+    """
+    attachment = record.env['ir.attachment'].sudo().search([
+        ('res_model', '=', record._name),
+        ('res_field', '=', field_name),
+        ('res_id', '=', record.id),
+    ], limit=1)
+    if not attachment:
+        return None
+    if attachment.store_fname:
+        return open(attachment._full_path(attachment.store_fname), 'rb')
+    return io.BytesIO(attachment.raw or b'')
+
+def create_attachment_from_file(env, path, vals):
+    """
+    Create an attachment from a file on disk without loading it in memory.
+
+    With filestore storage the file is hashed block by block and copied
+    into the filestore, otherwise it is read and stored as usual.
+
+    :param env: The environment to create the attachment with
+    :param path: The path of the file to attach
+    :param vals: The other values of the attachment, e.g. name, res_model and res_id
+    :return: The created ir.attachment record
+    """
+    IrAttachment = env['ir.attachment']
+    if IrAttachment._storage() != 'file':
+        with open(path, 'rb') as file:
+            return IrAttachment.create(dict(vals, raw=file.read()))
+
+    sha = hashlib.sha1()
+    file_size = 0
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            sha.update(block)
+            file_size += len(block)
+    checksum = sha.hexdigest()
+
+    # Same layout as ir.attachment._get_path, a file with the same checksum is reused
+    fname = f"{checksum[:2]}/{checksum}"
+    full_path = IrAttachment._full_path(fname)
+    if not os.path.isfile(full_path):
+        legacy_fname = f"{checksum[:3]}/{checksum}"
+        if os.path.isfile(IrAttachment._full_path(legacy_fname)):
+            fname = legacy_fname
+        else:
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            shutil.copyfile(path, full_path)
+            # Let the filestore garbage collection remove it if the transaction is rolled back
+            IrAttachment._mark_for_gc(fname)
+
+    # create() drops store_fname, checksum and file_size as it computes them
+    # from the content, so they are set on the created attachment directly
+    attachment = IrAttachment.create(dict(vals, type='binary'))
+    mimetype = vals.get('mimetype') or mimetypes.guess_type(vals.get('name') or '')[0] or 'application/octet-stream'
+    attachment.flush_recordset()
+    env.cr.execute("""
+        UPDATE ir_attachment
+           SET store_fname = %s, checksum = %s, file_size = %s, mimetype = %s
+         WHERE id = %s
+    """, (fname, checksum, file_size, mimetype, attachment.id))
+    attachment.invalidate_recordset()
+    return attachment
+
+def _as_stream(file_content):
+    return io.BytesIO(file_content) if isinstance(file_content, bytes) else file_content
+
+def sniff_csv_delimiter(sample):
+    """
+    Guess the delimiter of a CSV file from a sample of its first bytes.
+
+    :param sample: The first bytes of the file
+    :return: The delimiter, ';' when it can't be guessed
+    """
+    text = sample.decode(CSV_ENCODING, errors='ignore')
+    # Only look at complete lines, the last one may be cut in the middle
+    if '\n' in text:
+        text = text[:text.rindex('\n')]
+    try:
+        return csv.Sniffer().sniff(text, delimiters=CSV_DELIMITERS).delimiter
+    except csv.Error:
+        return CSV_DEFAULT_DELIMITER
+
+def read_csv_header(file_content):
+    """
+    Read the column names of a CSV file from its first few KB only.
+
+    :param file_content: The content of the CSV file as bytes, or a binary file object
+    :return: A list with the column names
+    """
+    sample = _as_stream(file_content).read(CSV_SNIFF_SIZE)
+    delimiter = sniff_csv_delimiter(sample)
+    first_line = sample.decode(CSV_ENCODING, errors='ignore').splitlines()[:1]
+    return next(csv.reader(first_line, delimiter=delimiter), [])
+
+def count_csv_rows(file_content, block_size=1 << 20):
+    """
+    Count the data rows of a CSV file by counting line breaks block by block.
+    Quoted values spanning several lines make this an estimate.
+    """
+    stream = _as_stream(file_content)
+    lines = 0
+    for block in iter(lambda: stream.read(block_size), b''):
+        lines += block.count(b'\n')
+    return max(0, lines - 1)
+
+def process_csv(file_content, chunk_size=1000, delimiter=None):
     """
-    Process a CSV file and return its contents as a list of dictionaries.
+    Process a CSV file and yield its rows in chunks of dictionaries.
 
-    :param file_content: The content of the CSV file as bytes
-    :return: A list of dictionaries, where each dictionary represents a row in the CSV file
+    The file is decoded incrementally while it is read, so only the current
+    chunk is held in memory. A UTF-8 byte order mark is skipped and the
+    delimiter is sniffed from the first few KB unless it is given.
+
+    :param file_content: The content of the CSV file as bytes, or a seekable binary file object
+    :param chunk_size: The number of rows per chunk
+    :param delimiter: The delimiter to use instead of the sniffed one
+    :return: A generator of lists of dictionaries, where each dictionary represents a row in the CSV file
     :raises UserError: If there's an error processing the CSV file
     """
     try:
-        csv_data = io.StringIO(file_content.decode('utf-8'))
-        reader = csv.DictReader(csv_data, delimiter=';')
+        stream = _as_stream(file_content)
+        if delimiter is None:
+            start = stream.tell()
+            delimiter = sniff_csv_delimiter(stream.read(CSV_SNIFF_SIZE))
+            stream.seek(start)
+
+        text = io.TextIOWrapper(stream, encoding=CSV_ENCODING, newline='')
+        reader = csv.DictReader(text, delimiter=delimiter)
         
         chunk = []
         for row in reader:
@@ -32,37 +176,259 @@ def process_csv(file_content, chunk_size=1000):
     except Exception as e:
         raise UserError(_('Error processing CSV file: %s') % str(e))
 
-def process_excel(file_content, chunk_size=1000):
+XLSX_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+XLSX_REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+XLSX_PACKAGE_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+def _format_excel_value(value):
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+def _xlsx_sheet_path(archive, sheet_name=None):
     """
-    Process an Excel file and return its contents as a list of dictionaries.
+    Find the path of a worksheet inside an .xlsx archive.
 
-    :param file_content: The content of the Excel file as bytes
-    :return: A list of dictionaries, where each dictionary represents a row in the Excel file
-    :raises UserError: If there's an error processing the Excel file
+    :param archive: The opened zipfile.ZipFile
+    :param sheet_name: The name of the worksheet, the first one when empty
+    :return: The path of the worksheet XML in the archive
+    """
+    workbook = ElementTree.parse(archive.open('xl/workbook.xml')).getroot()
+    sheets = workbook.findall(f'{XLSX_NS}sheets/{XLSX_NS}sheet')
+    if not sheets:
+        raise UserError(_('The Excel file contains no worksheets.'))
+    if sheet_name:
+        sheets = [sheet for sheet in sheets if sheet.get('name') == sheet_name]
+        if not sheets:
+            raise UserError(_("Worksheet '%s' not found in the Excel file.") % sheet_name)
+    rel_id = sheets[0].get(f'{XLSX_REL_NS}id')
+
+    rels = ElementTree.parse(archive.open('xl/_rels/workbook.xml.rels')).getroot()
+    for rel in rels.iter(f'{XLSX_PACKAGE_REL_NS}Relationship'):
+        if rel.get('Id') == rel_id:
+            target = rel.get('Target')
+            return target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join('xl', target))
+    raise UserError(_('The Excel file is missing the worksheet of the selected sheet.'))
+
+class XlsxSharedStrings:
+    """
+    The shared strings table of an .xlsx archive, indexed like the 's' cell
+    references. Kept in a list until it holds memory_limit strings, then
+    moved to a temporary SQLite database, as a sheet of unique serial
+    numbers has about as many shared strings as rows.
     """
+
+    def __init__(self, memory_limit=SHARED_STRINGS_MEMORY_LIMIT):
+        self.memory_limit = memory_limit
+        self._memory = []
+        self._pending = []
+        self._count = 0
+        self._db = None
+        self._path = None
+
+    def append(self, text):
+        if self._db is None:
+            self._memory.append(text)
+            if len(self._memory) > self.memory_limit:
+                self._spill()
+        else:
+            self._pending.append((self._count, text))
+            if len(self._pending) >= SQLITE_BATCH_SIZE:
+                self._flush()
+        self._count += 1
+
+    def __getitem__(self, index):
+        if self._db is None:
+            return self._memory[index]
+        self._flush()
+        row = self._db.execute("SELECT text FROM strings WHERE id = ?", (index,)).fetchone()
+        if row is None:
+            raise IndexError(index)
+        return row[0]
+
+    def _spill(self):
+        fd, self._path = tempfile.mkstemp(prefix='xlsx_strings_', suffix='.sqlite')
+        os.close(fd)
+        _logger.info(f"Moving {len(self._memory)} shared strings to {self._path}")
+        self._db = sqlite3.connect(self._path)
+        self._db.execute("PRAGMA journal_mode = OFF")
+        self._db.execute("PRAGMA synchronous = OFF")
+        self._db.execute("CREATE TABLE strings (id INTEGER PRIMARY KEY, text TEXT NOT NULL)")
+        self._db.executemany("INSERT INTO strings (id, text) VALUES (?, ?)", enumerate(self._memory))
+        self._memory = []
+
+    def _flush(self):
+        if self._pending:
+            self._db.executemany("INSERT INTO strings (id, text) VALUES (?, ?)", self._pending)
+            self._pending = []
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+            os.unlink(self._path)
+        self._memory = []
+        self._pending = []
+
+def _xlsx_shared_strings(archive):
+    """
+    Resolve the shared strings table of an .xlsx archive once, element by
+    element, into an XlsxSharedStrings indexed like the 's' cell references.
+    """
+    strings = XlsxSharedStrings()
+    if 'xl/sharedStrings.xml' not in archive.namelist():
+        return strings
+    for event, elem in ElementTree.iterparse(archive.open('xl/sharedStrings.xml'), events=('end',)):
+        if elem.tag == f'{XLSX_NS}si':
+            # Plain text is in <t>, rich text in <r><t>, phonetic runs (<rPh>) are skipped
+            text = elem.find(f'{XLSX_NS}t')
+            if text is not None:
+                strings.append(text.text or '')
+            else:
+                strings.append(''.join(t.text or '' for t in elem.iterfind(f'{XLSX_NS}r/{XLSX_NS}t')))
+            elem.clear()
+    return strings
+
+def _xlsx_column_index(reference):
+    index = 0
+    for char in reference:
+        if not char.isalpha():
+            break
+        index = index * 26 + ord(char.upper()) - 64
+    return index - 1
+
+def _xlsx_cell_value(cell, shared_strings):
+    cell_type = cell.get('t', 'n')
+    if cell_type == 'inlineStr':
+        return ''.join(t.text or '' for t in cell.iter(f'{XLSX_NS}t'))
+    value = cell.findtext(f'{XLSX_NS}v')
+    if value is None:
+        return ''
+    if cell_type == 's':
+        return shared_strings[int(value)]
+    if cell_type in ('str', 'e'):
+        return value
+    if cell_type == 'b':
+        return str(int(value))
     try:
-        workbook = xlrd.open_workbook(file_contents=file_content)
-        sheet = workbook.sheet_by_index(0)
-        headers = [str(cell.value).strip() for cell in sheet.row(0)]
-        
-        chunk = []
-        for row_index in range(1, sheet.nrows):
-            row_data = {}
-            for col, header in enumerate(headers):
-                cell_value = sheet.cell_value(row_index, col)
-                if isinstance(cell_value, float) and cell_value.is_integer():
-                    cell_value = int(cell_value)
-                row_data[header] = str(cell_value).strip()
-            chunk.append(row_data)
-            if len(chunk) == chunk_size:
-                yield chunk
-                chunk = []
-        if chunk:
+        return _format_excel_value(float(value))
+    except ValueError:
+        return value
+
+def _iter_xlsx_rows(stream, sheet_name=None):
+    """
+    Yield the rows of an .xlsx worksheet as lists of strings.
+
+    The worksheet XML is parsed row by row and every parsed row is dropped
+    from the tree right away, so memory stays flat whatever the sheet size.
+    """
+    with zipfile.ZipFile(stream) as archive:
+        shared_strings = _xlsx_shared_strings(archive)
+        try:
+            sheet_path = _xlsx_sheet_path(archive, sheet_name)
+            sheet_data = None
+            for event, elem in ElementTree.iterparse(archive.open(sheet_path), events=('start', 'end')):
+                if event == 'start':
+                    if elem.tag == f'{XLSX_NS}sheetData':
+                        sheet_data = elem
+                    continue
+                if elem.tag != f'{XLSX_NS}row':
+                    continue
+                values = []
+                for cell in elem.iterfind(f'{XLSX_NS}c'):
+                    reference = cell.get('r')
+                    col = _xlsx_column_index(reference) if reference else len(values)
+                    if col > len(values):
+                        values.extend([''] * (col - len(values)))
+                    values.append(_xlsx_cell_value(cell, shared_strings))
+                yield values
+                if sheet_data is not None:
+                    sheet_data.clear()
+        finally:
+            shared_strings.close()
+
+def _process_xlsx(stream, chunk_size=1000, sheet_name=None):
+    rows = _iter_xlsx_rows(stream, sheet_name)
+    headers = [header.strip() for header in next(rows, [])]
+
+    chunk = []
+    for values in rows:
+        row_data = {}
+        for col, header in enumerate(headers):
+            row_data[header] = values[col].strip() if col < len(values) else ''
+        chunk.append(row_data)
+        if len(chunk) == chunk_size:
             yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _process_xls(file_content, chunk_size=1000, sheet_name=None):
+    workbook = xlrd.open_workbook(file_contents=file_content)
+    sheet = workbook.sheet_by_name(sheet_name) if sheet_name else workbook.sheet_by_index(0)
+    headers = [str(cell.value).strip() for cell in sheet.row(0)]
+    
+    chunk = []
+    for row_index in range(1, sheet.nrows):
+        row_data = {}
+        for col, header in enumerate(headers):
+            row_data[header] = _format_excel_value(sheet.cell_value(row_index, col))
+        chunk.append(row_data)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def process_excel(file_content, chunk_size=1000, sheet_name=None):
+    """
+    Process an Excel file and yield its rows in chunks of dictionaries.
+
+    .xlsx files are streamed: the worksheet XML is parsed row by row and the
+    shared strings are resolved once, moving to a temporary SQLite file when
+    there are many, so memory doesn't grow with the number of rows. Legacy .xls files are read with xlrd.
+
+    :param file_content: The content of the Excel file as bytes, or a seekable binary file object
+    :param chunk_size: The number of rows per chunk
+    :param sheet_name: The name of the worksheet to read, the first one when empty
+    :return: A generator of lists of dictionaries, where each dictionary represents a row in the Excel file
+    :raises UserError: If there's an error processing the Excel file
+    """
+    try:
+        stream = _as_stream(file_content)
+        if zipfile.is_zipfile(stream):
+            stream.seek(0)
+            yield from _process_xlsx(stream, chunk_size, sheet_name)
+        else:
+            stream.seek(0)
+            yield from _process_xls(stream.read(), chunk_size, sheet_name)
 
     except Exception as e:
         raise UserError(_('Error processing Excel file: %s') % str(e))
 
+def count_excel_rows(file_content, sheet_name=None):
+    """
+    Estimate the number of data rows of an Excel file. For .xlsx files this
+    only reads the dimension at the top of the worksheet XML.
+    """
+    stream = _as_stream(file_content)
+    if zipfile.is_zipfile(stream):
+        stream.seek(0)
+        with zipfile.ZipFile(stream) as archive:
+            sheet_path = _xlsx_sheet_path(archive, sheet_name)
+            for event, elem in ElementTree.iterparse(archive.open(sheet_path), events=('start',)):
+                if elem.tag == f'{XLSX_NS}dimension':
+                    last_cell = elem.get('ref', '').split(':')[-1]
+                    digits = ''.join(char for char in last_cell if char.isdigit())
+                    return max(0, int(digits) - 1) if digits else 0
+                if elem.tag == f'{XLSX_NS}sheetData':
+                    break
+        return 0
+    stream.seek(0)
+    workbook = xlrd.open_workbook(file_contents=stream.read(), on_demand=True)
+    sheet = workbook.sheet_by_name(sheet_name) if sheet_name else workbook.sheet_by_index(0)
+    return max(0, sheet.nrows - 1)
+
 def log_and_notify(message, error_type="error"):
     """
     Log a message using Odoo's logging system.
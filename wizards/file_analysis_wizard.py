@@ -1,8 +1,9 @@
 import base64
+import io
 from odoo import models, fields, api
 from odoo.tools.translate import _
 from odoo.exceptions import UserError
-from ..models.utils import process_csv, process_excel
+from ..models.utils import process_csv, process_excel, open_binary_field
 
 class FileAnalysisWizard(models.TransientModel):
     _name = 'file.analysis.wizard'
@@ -42,13 +43,13 @@ class FileAnalysisWizard(models.TransientModel):
             self.write({'state': 'warning', 'warning_message': _("Please select exactly two fields for analysis.")})
             return self._reopen_view()
     
-        file_content = base64.b64decode(self.file)
+        stream = open_binary_field(self, 'file') or io.BytesIO(base64.b64decode(self.file))
         
         try:
             if self.file_type == 'csv':
-                data = process_csv(file_content)
+                data = process_csv(stream)
             elif self.file_type == 'excel':
-                data = process_excel(file_content)
+                data = process_excel(stream, sheet_name=self.import_config_id.sheet_name)
             else:
                 raise UserError(_("Unsupported file format."))
     
@@ -69,6 +70,9 @@ class FileAnalysisWizard(models.TransientModel):
             self.write({'state': 'warning', 'warning_message': _(f"Error during file analysis: {str(e)}")})
             return self._reopen_view()
 
+        finally:
+            stream.close()
+
     def _reopen_view(self):
         return {
             'name': _('File Analysis Result'),
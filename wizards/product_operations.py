@@ -1,11 +1,24 @@
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
 import base64
+import io
 import logging
-from ..models.utils import process_csv, process_excel, log_and_notify, collect_errors
+import random
+import time
+from collections import Counter
+
+import psycopg2
+
+from odoo.service.model import PG_CONCURRENCY_ERRORS_TO_RETRY
+from ..models.dedup import SeenSerialNumbers
+from ..models.import_run import ImportTelemetry
+from ..models.utils import log_and_notify, collect_errors, process_csv, process_excel, open_binary_field
 
 _logger = logging.getLogger(__name__)
 
+MAX_CHUNK_ATTEMPTS = 5
+PREVIEW_TOP_UNMATCHED = 10
+
 class ImportProductInfo(models.TransientModel):
     _name = 'import.product.info'
     _description = 'Import Product Information'
@@ -18,6 +31,11 @@ class ImportProductInfo(models.TransientModel):
         ('done', 'Done')
     ], default='draft', string='Status')
     result_message = fields.Text(string='Import Result', readonly=True)
+    process_count = fields.Integer(string='Processes', default=1,
+                                   help="Split the file over this many processes to import large files in parallel.")
+    preview_size = fields.Integer(string='Preview Rows', default=10000,
+                                  help="Number of rows read by Preview. Use 0 to preview the whole file.")
+    preview_message = fields.Text(string='Preview', readonly=True)
 
     def import_file(self):
         self.ensure_one()
@@ -28,164 +46,377 @@ class ImportProductInfo(models.TransientModel):
         if not config:
             raise UserError(_('Please select an import configuration.'))
 
-        file_content = base64.b64decode(self.file)
-        
+        job = self.env['import.product.job'].create({
+            'import_config_id': config.id,
+            'file': self.file,
+            'file_name': self.file_name,
+            'process_count': max(1, self.process_count),
+        })
+        job._trigger_runners()
+
+        # The import runs in the background, open the job to follow its progress
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': 'import.product.job',
+            'res_id': job.id,
+            'view_mode': 'form',
+            'target': 'current',
+        }
+
+    def action_preview(self):
+        """
+        Run the file through the map and match stages without writing
+        anything, and show what an import would do.
+        """
+        self.ensure_one()
+        # bin_size only checks that there is a file, without reading it
+        if not self.with_context(bin_size=True).file:
+            raise UserError(_('Please select a file to import.'))
+        config = self.import_config_id
+
+        if config.file_type not in ('csv', 'excel'):
+            raise UserError(_('Unsupported file format. Please use CSV or Excel files.'))
+        sample_size = max(0, self.preview_size)
+
+        # Read the file from the filestore, only as far as the sample goes
+        stream = open_binary_field(self, 'file') or io.BytesIO(base64.b64decode(self.file))
         try:
-            if config.file_type == 'csv':
-                data = process_csv(file_content)
-            elif config.file_type == 'excel':
-                data = process_excel(file_content)
-            else:
-                raise UserError(_('Unsupported file format. Please use CSV or Excel files.'))
-
-            if not data:
-                raise UserError(_('No data found in the file.'))
-
-            result = self.process_rows(data, config)
-
-            message = _(
-                'Processed {total} rows, created {created} new records, '
-                'updated {updated} existing records, '
-                'added {unmatched} to unmatched models.'
-            ).format(
-                total=result['total'],
-                created=result['created'],
-                updated=result['updated'],
-                unmatched=result['unmatched']
-            )
-
-            if result['errors']:
-                error_message = collect_errors(result['errors'])
-                message += _("\n\nErrors occurred during import. Check the logs for details.")
-                log_level = "warning"
-            else:
-                log_level = "info"
-
-            log_and_notify(message, error_type=log_level)
-
-            # Update the state to 'done' and set the result message
-            self.write({
-                'state': 'done',
-                'result_message': message
-            })
-            
-            # Return an action to keep the wizard open and display the result
-            return {
-                'type': 'ir.actions.act_window',
-                'res_model': 'import.product.info',
-                'res_id': self.id,
-                'view_mode': 'form',
-                'view_type': 'form',
-                'target': 'new',
-                'context': {'form_view_initial_mode': 'edit'},
-            }
-
-        except Exception as e:
-            error_message = _("Error during file import: {}").format(str(e))
-            _logger.error(error_message, exc_info=True)
-            log_and_notify(error_message, error_type="error")
-            
-            # Send a sticky notification for the error
-            self.env['bus.bus']._sendone(self.env.user.partner_id, 'simple_notification', {
-                'title': _('Import Error'),
-                'message': error_message,
-                'type': 'danger',
-                'sticky': True,
-            })
-            
-            raise UserError(error_message)
+            skip_rows = set()
+            if (config.duplicate_sn_policy or 'last') == 'last':
+                # Rows replaced by a later row of the sample, as the import leaves them out
+                skip_rows = self._get_replaced_rows(self._read_preview_file(stream, config), config, sample_size)
+                stream.seek(0)
+            result = self.preview_rows(self._read_preview_file(stream, config), config,
+                                       sample_size=sample_size, skip_rows=skip_rows)
+            if not result['complete']:
+                stream.seek(0)
+                result['rows_total'] = self.env['import.product.job']._estimate_total_rows(stream, config)
+        finally:
+            stream.close()
+        self.preview_message = self._format_preview_message(result)
+
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
 
     @api.model
-    def process_rows(self, data, config):
-        IncomingProductInfo = self.env['incoming.product.info']
-        UnmatchedModelNo = self.env['unmatched.model.no']
-        
-        unmatched_models = {}
-        errors = []
-        total_processed = 0
-        total_created = 0
-        total_updated = 0
-        total_unmatched = 0
-        total_rule_without_product = 0
-        batch_size = 1000  # Define batch size
+    def _read_preview_file(self, stream, config):
+        if config.file_type == 'csv':
+            return process_csv(stream)
+        return process_excel(stream, sheet_name=config.sheet_name)
 
-        for chunk in data:
-            create_vals = []
-            update_vals = []
+    @api.model
+    def _get_replaced_rows(self, data, config, sample_size=0):
+        """
+        Find the rows of the first sample_size rows whose serial number
+        occurs again on a later row of the sample.
 
-            for index, row in enumerate(chunk, start=total_processed + 1):
-                try:
-                    values = self._process_row_values(row, config)
-                    
-                    if 'model_no' not in values or 'sn' not in values:
-                        _logger.warning(f"Skipping row {index}: Missing model_no or sn")
+        :return: A set of row numbers
+        """
+        mapping_plan = config._get_mapping_plan()
+        seen_sns = SeenSerialNumbers()
+        replaced = set()
+        last_rows = {}
+        total = 0
+        try:
+            for chunk in data:
+                if sample_size and total >= sample_size:
+                    break
+                if sample_size:
+                    chunk = chunk[:sample_size - total]
+                rows = []
+                for index, row in enumerate(chunk, start=total + 1):
+                    try:
+                        rows.append((index, mapping_plan.map_row(row)['sn']))
+                    except Exception:
                         continue
+                sns = dict(rows)
+                for index, first_row in seen_sns.check_chunk(rows).items():
+                    replaced.add(last_rows.get(sns[index], first_row))
+                    last_rows[sns[index]] = index
+                total += len(chunk)
+        finally:
+            seen_sns.close()
+        return replaced
 
-                    product = IncomingProductInfo._search_product(values, config)
-                    if product == 'rule_without_product':
-                        total_rule_without_product += 1
-                        _logger.info(f"Rule found but no product assigned for row {index}")
+    @api.model
+    def preview_rows(self, data, config, sample_size=0, skip_rows=None):
+        """
+        Project the outcome of importing rows, read-only: rows are mapped,
+        repeated serial numbers handled by the duplicate policy of the config
+        and their products resolved with the same batched lookups as an
+        import, and rows whose content hash equals the one of their record
+        are counted as unchanged. No record, unmatched model number or rule
+        count is written.
+
+        :param data: An iterable of chunks, each a list of row dictionaries
+        :param config: The import.format.config to map and match the rows with
+        :param sample_size: Stop after this many rows, 0 reads all rows
+        :param skip_rows: Optional set of row numbers replaced by a later row
+                          of the same serial number, counted as duplicates
+        :return: A dictionary with the projected counters, the most frequent
+                 unmatched model numbers and whether all rows were read
+        """
+        IncomingProductInfo = self.env['incoming.product.info']
+        import_context = IncomingProductInfo._get_import_context(config)
+        import_context.seen_sns = SeenSerialNumbers()
+        supplier_id = config.supplier_id.id
+        skip_rows = skip_rows or set()
+
+        result = {'total': 0, 'created': 0, 'updated': 0, 'unchanged': 0, 'duplicates': 0, 'unmatched': 0,
+                  'rule_without_product': 0, 'errors': 0, 'complete': True}
+        unmatched_models = Counter()
+        # Content hash of the serial numbers previewed so far, as written by an import
+        previewed_hashes = {}
+
+        try:
+            for chunk in data:
+                if sample_size and result['total'] >= sample_size:
+                    result['complete'] = False
+                    break
+                if sample_size:
+                    chunk = chunk[:sample_size - result['total']]
+                chunk_start = result['total'] + 1
+                result['total'] += len(chunk)
+
+                skipped = [(index, row) for index, row in enumerate(chunk, start=chunk_start)
+                           if index in skip_rows]
+                chunk_result = {'duplicates': 0, 'errors': []}
+                self._count_skipped_rows(skipped, config, chunk_result)
+
+                mapped_rows = []
+                for index, row in enumerate(chunk, start=chunk_start):
+                    if index in skip_rows:
+                        continue
+                    try:
+                        values = import_context.mapping_plan.map_row(row)
+                    except Exception:
+                        result['errors'] += 1
                         continue
+                    if 'model_no' in values and 'sn' in values:
+                        mapped_rows.append((index, row, values))
 
-                    if product:
-                        values['product_id'] = product.id
-                        values['supplier_id'] = config.supplier_id.id
+                mapped_rows = self._drop_duplicate_rows(mapped_rows, config, import_context, chunk_result)
+                result['duplicates'] += chunk_result['duplicates']
+                # Repeated serial numbers are errors under the 'error' policy, as in the import
+                result['errors'] += len(chunk_result['errors'])
+
+                resolved = IncomingProductInfo._resolve_products(
+                    [values for index, row, values in mapped_rows], config, import_context)
+                matched_vals = []
+                for index, row, values in mapped_rows:
+                    product, rule_ids = resolved[IncomingProductInfo._get_product_key(values, import_context.rule_fields)]
+                    if product == 'rule_without_product':
+                        result['rule_without_product'] += 1
+                    elif product:
+                        values = dict(values, product_id=product.id, supplier_id=supplier_id)
                         if 'supplier_product_code' not in values:
                             values['supplier_product_code'] = values.get('model_no', '')
+                        matched_vals.append(values)
+                    else:
+                        result['unmatched'] += 1
+                        unmatched_models[values['model_no']] += 1
 
-                        existing_info = IncomingProductInfo.search([
-                            ('supplier_id', '=', config.supplier_id.id),
-                            ('sn', '=', values['sn'])
-                        ], limit=1)
-
-                        if existing_info:
-                            # If the record exists, keep its current state
-                            values['state'] = existing_info.state
-                            update_vals.append((existing_info.id, values))
-                            _logger.info(f"Updating existing record for SN: {values['sn']}, State: {values['state']}")
-                        else:
-                            # For new records, set state to 'received' since we're importing existing data
-                            values['state'] = 'received'
-                            create_vals.append(values)
-                            _logger.info(f"Preparing to create new record for SN: {values['sn']}, State: received")
+                existing = IncomingProductInfo._get_existing_by_sn(
+                    supplier_id, list({values['sn'] for values in matched_vals} - set(previewed_hashes)))
+                for values in matched_vals:
+                    sn = values['sn']
+                    content_hash = IncomingProductInfo._get_content_hash(values)
+                    if sn in previewed_hashes:
+                        previous_hash = previewed_hashes[sn]
+                    elif sn in existing:
+                        previous_hash = existing[sn][2]
                     else:
-                        total_unmatched += 1
-                        IncomingProductInfo._add_to_unmatched_models(values, config)
-                        unmatched_models[values.get('model_no')] = unmatched_models.get(values.get('model_no'), 0) + 1
-                        _logger.info(f"Added to unmatched models: {values.get('model_no')}")
+                        result['created'] += 1
+                        previewed_hashes[sn] = content_hash
+                        continue
+                    if previous_hash == content_hash:
+                        result['unchanged'] += 1
+                    else:
+                        result['updated'] += 1
+                    previewed_hashes[sn] = content_hash
+        finally:
+            import_context.seen_sns.close()
 
-                except Exception as e:
-                    errors.append((index, row, str(e)))
-                    _logger.error(f"Error processing row {index}: {str(e)}", exc_info=True)
-            
-            total_processed += len(chunk)
-            
-            # Batch create
-            if create_vals:
-                created_records = IncomingProductInfo.create(create_vals)
-                total_created += len(created_records)
-                _logger.info(f"Created {len(created_records)} new records in this batch")
-            
-            # Batch update
-            if update_vals:
-                for record_id, values in update_vals:
-                    IncomingProductInfo.browse(record_id).write(values)
-                total_updated += len(update_vals)
-                _logger.info(f"Updated {len(update_vals)} existing records in this batch")
-
-            # Process in batches
-            if total_created + total_updated >= batch_size:
-                self.env.cr.commit()  # Commit the transaction
+        result['top_unmatched'] = unmatched_models.most_common(PREVIEW_TOP_UNMATCHED)
+        result['unmatched_models'] = len(unmatched_models)
+        return result
+
+    @api.model
+    def _format_preview_message(self, result):
+        lines = [
+            _("Preview of {total} rows, nothing was imported:").format(total=result['total']),
+            _("- To create: {created}").format(created=result['created']),
+            _("- To update: {updated}").format(updated=result['updated']),
+            _("- Unchanged: {unchanged}").format(unchanged=result['unchanged']),
+            _("- Duplicates dropped: {duplicates}").format(duplicates=result['duplicates']),
+            _("- Unmatched: {unmatched} rows of {models} model numbers").format(
+                unmatched=result['unmatched'], models=result['unmatched_models']),
+            _("- Rule without product: {count}").format(count=result['rule_without_product']),
+            _("- Errors: {errors}").format(errors=result['errors']),
+        ]
+        rows_total = result.get('rows_total', 0)
+        if not result['complete'] and result['total'] and rows_total > result['total']:
+            factor = rows_total / result['total']
+            lines += [
+                "",
+                _("Projected for about {rows} rows: {created} to create, {updated} to update, "
+                  "{unchanged} unchanged, {unmatched} unmatched, {rule} with a rule without product").format(
+                    rows=rows_total,
+                    created=round(result['created'] * factor),
+                    updated=round(result['updated'] * factor),
+                    unchanged=round(result['unchanged'] * factor),
+                    unmatched=round(result['unmatched'] * factor),
+                    rule=round(result['rule_without_product'] * factor)),
+            ]
+        if result['top_unmatched']:
+            lines += ["", _("Top unmatched model numbers:")]
+            lines += [f"- {model_no}: {count}" for model_no, count in result['top_unmatched']]
+        return "\n".join(lines)
+
+    @api.model
+    def process_rows(self, data, config, job=None, row_range=None, skip_rows=None, telemetry=None, row_offset=0):
+        """
+        Import the rows of a file chunk by chunk.
+
+        :param data: An iterable of chunks, each a list of row dictionaries
+        :param config: The import.format.config to map and match the rows with
+        :param job: Optional import.product.job running the import. Progress is
+                    reported to it after each chunk, every chunk is committed
+                    and the import stops between chunks when it is cancelled.
+        :param row_range: Optional (first, last) 1-based row numbers to import,
+                          the other rows of the file are only read
+        :param skip_rows: Optional set of row numbers to leave out because
+                          another row with the same serial number wins. They
+                          are counted as dropped duplicates.
+        :param telemetry: Optional ImportTelemetry collecting the stage timings
+                          of the import, a new one is used when not given
+        :param row_offset: Number of rows of the file before the first chunk
+                           of data, when data starts in the middle of the file
+        :return: A dictionary with the import counters and errors, and the
+                 telemetry stats under 'telemetry'
+        """
+        IncomingProductInfo = self.env['incoming.product.info']
+        UnmatchedModelNo = self.env['unmatched.model.no']
+        
+        # Pick up the running totals of an interrupted run of the job
+        checkpoint = job._get_checkpoint() if job else {}
+        first_row, last_row = row_range or (1, None)
+        skip_until = max(checkpoint.get('total', 0), first_row - 1)
+        skip_rows = skip_rows or set()
+
+        errors = list(checkpoint.get('errors', []))
+        total_processed = checkpoint.get('total', 0)
+        total_created = checkpoint.get('created', 0)
+        total_updated = checkpoint.get('updated', 0)
+        total_unchanged = checkpoint.get('unchanged', 0)
+        total_unmatched = checkpoint.get('unmatched_rows', 0)
+        total_rule_without_product = checkpoint.get('rule_without_product', 0)
+        total_duplicates = checkpoint.get('duplicates', 0)
+        batch_size = 1000  # Define batch size
+
+        # Supplier hierarchy, supplier codes and resolved products for the whole import
+        import_context = IncomingProductInfo._get_import_context(config)
+        telemetry = telemetry or ImportTelemetry(self.env.cr)
+        telemetry.resumed_rows = checkpoint.get('total', 0)
+        import_context.telemetry = telemetry
+        import_context.seen_sns = SeenSerialNumbers()
+
+        cancelled = False
+        rows_seen = row_offset
+
+        try:
+            for chunk in telemetry.iter_chunks(data):
+                chunk_start = rows_seen + 1
+                rows_seen += len(chunk)
+                if rows_seen <= skip_until:
+                    # Already committed by an interrupted run, or before our row range.
+                    # Rows committed by an interrupted run still count for duplicates.
+                    if checkpoint and rows_seen >= first_row:
+                        self._record_serial_numbers(chunk, chunk_start, first_row, import_context)
+                    continue
+                if last_row and chunk_start > last_row:
+                    break
+
+                rows = [
+                    (index, row) for index, row in enumerate(chunk, start=chunk_start)
+                    if index > skip_until and (not last_row or index <= last_row)
+                ]
+
+                for attempt in range(1, MAX_CHUNK_ATTEMPTS + 1):
+                    if job and job._check_cancelled():
+                        cancelled = True
+                        _logger.info(f"Import job {job.id} cancelled after {total_processed} rows")
+                        break
+
+                    try:
+                        chunk_result = self._process_chunk(
+                            [(index, row) for index, row in rows if index not in skip_rows],
+                            config, import_context)
+                        self._count_skipped_rows(
+                            [(index, row) for index, row in rows if index in skip_rows], config, chunk_result)
+
+                        if job:
+                            job._update_progress({
+                                'total': total_processed + len(rows),
+                                'created': total_created + chunk_result['created'],
+                                'updated': total_updated + chunk_result['updated'],
+                                'unchanged': total_unchanged + chunk_result['unchanged'],
+                                'unmatched_rows': total_unmatched + chunk_result['unmatched'],
+                                'rule_without_product': total_rule_without_product + chunk_result['rule_without_product'],
+                                'duplicates': total_duplicates + chunk_result['duplicates'],
+                                'errors': errors + chunk_result['errors'],
+                                'resumed_from': skip_until,
+                                'error_offset': checkpoint.get('error_offset', 0),
+                            })
+                            with telemetry.stage('commit', len(rows)):
+                                self.env.cr.commit()
+                        break
+
+                    except psycopg2.OperationalError as e:
+                        # Only a chunk committed on its own can be retried
+                        if not job or e.pgcode not in PG_CONCURRENCY_ERRORS_TO_RETRY or attempt == MAX_CHUNK_ATTEMPTS:
+                            raise
+                        self.env.cr.rollback()
+                        wait = random.uniform(0.0, 2 ** attempt)
+                        _logger.info(f"Concurrent update while importing rows {rows[0][0]}-{rows[-1][0]}, "
+                                     f"retrying in {wait:.2f}s")
+                        time.sleep(wait)
+
+                if cancelled:
+                    break
+
+                total_processed += len(rows)
+                total_created += chunk_result['created']
+                total_updated += chunk_result['updated']
+                total_unchanged += chunk_result['unchanged']
+                total_unmatched += chunk_result['unmatched']
+                total_rule_without_product += chunk_result['rule_without_product']
+                total_duplicates += chunk_result['duplicates']
+                errors += chunk_result['errors']
+
+                # Process in batches
+                if not job and total_created + total_updated >= batch_size:
+                    with telemetry.stage('commit', len(rows)):
+                        self.env.cr.commit()  # Commit the transaction
                 _logger.info(f"Batch processed: Total Created {total_created}, Total Updated {total_updated}, "
                              f"Total Unmatched {total_unmatched}, Total Rule Without Product {total_rule_without_product}")
+        finally:
+            import_context.seen_sns.close()
 
         # Get the final count of unmatched models
         unmatched_count = UnmatchedModelNo.search_count([('config_id', '=', config.id)])
         total_unmatched_rows = sum(UnmatchedModelNo.search([('config_id', '=', config.id)]).mapped('count'))
 
         _logger.info(f"Final count - Processed {total_processed} rows, created {total_created} new records, "
-                     f"updated {total_updated} existing records, {unmatched_count} unique unmatched models "
-                     f"(total {total_unmatched_rows} unmatched rows), {total_rule_without_product} rows with rule but no product")
+                     f"updated {total_updated} existing records, skipped {total_unchanged} unchanged records, "
+                     f"{unmatched_count} unique unmatched models "
+                     f"(total {total_unmatched_rows} unmatched rows), {total_rule_without_product} rows with rule but no product, "
+                     f"{total_duplicates} duplicate serial numbers dropped")
 
         if errors:
             error_message = collect_errors(errors)
@@ -195,35 +426,176 @@ class ImportProductInfo(models.TransientModel):
             'total': total_processed,
             'created': total_created,
             'updated': total_updated,
+            'unchanged': total_unchanged,
             'unmatched': unmatched_count,
             'unmatched_rows': total_unmatched_rows,
+            'imported_unmatched_rows': total_unmatched,
             'rule_without_product': total_rule_without_product,
-            'errors': errors
+            'duplicates': total_duplicates,
+            'errors': errors,
+            'cancelled': cancelled,
+            'telemetry': telemetry.get_stats(),
         }
 
-    def _process_row_values(self, row, config):
-        values = {}
-        for mapping in config.column_mapping:
-            source_column = mapping.source_column
-            dest_field = mapping.destination_field_name
-            source_value = row.get(source_column, '').strip()
-            
-            if dest_field and source_value:
-                values[dest_field] = source_value
-                _logger.info(f"Mapped '{source_column}' to '{dest_field}': {source_value}")
-            elif dest_field:
-                _logger.warning(f"Missing value for '{source_column}' (maps to '{dest_field}')")
-    
-        # Ensure required fields are present
-        required_fields = ['sn', 'model_no']
-        for field in required_fields:
-            if field not in values:
-                raise ValueError(f"Required field '{field}' is missing")
-    
-        # Handle supplier_product_code
-        if 'supplier_product_code' not in values or not values['supplier_product_code']:
-            values['supplier_product_code'] = values.get('model_no', '')
-            _logger.info(f"Using {values['supplier_product_code']} as supplier_product_code")
-    
-        _logger.info(f"Processed values for row: {values}")
-        return values
\ No newline at end of file
+    @api.model
+    def _process_chunk(self, rows, config, import_context):
+        """
+        Map, match and store one chunk of rows.
+
+        :param rows: A list of (row number, row dictionary) tuples
+        :param config: The import.format.config to map and match the rows with
+        :param import_context: The ImportContext of the import, shared by all chunks
+        :return: A dictionary with the counters and errors of the chunk
+        """
+        IncomingProductInfo = self.env['incoming.product.info']
+        ImportCombinationRule = self.env['import.combination.rule']
+        UnmatchedModelNo = self.env['unmatched.model.no']
+        telemetry = import_context.telemetry
+
+        result = {'created': 0, 'updated': 0, 'unchanged': 0, 'unmatched': 0, 'rule_without_product': 0,
+                  'duplicates': 0, 'errors': []}
+        upsert_vals = []
+
+        mapped_rows = []
+        with telemetry.stage('map', len(rows)):
+            for index, row in rows:
+                try:
+                    values = import_context.mapping_plan.map_row(row)
+
+                    if 'model_no' not in values or 'sn' not in values:
+                        _logger.warning(f"Skipping row {index}: Missing model_no or sn")
+                        continue
+                    mapped_rows.append((index, row, values))
+
+                except Exception as e:
+                    result['errors'].append((index, row, str(e)))
+                    _logger.error(f"Error processing row {index}: {str(e)}", exc_info=True)
+
+            # Drop repeated serial numbers before they cost any database round trip
+            mapped_rows = self._drop_duplicate_rows(mapped_rows, config, import_context, result)
+
+        unmatched_rows = []
+        rule_hits = set()
+        with telemetry.stage('match', len(mapped_rows)):
+            # Resolve the products of all distinct keys in the chunk at once
+            resolved = IncomingProductInfo._resolve_products(
+                [values for index, row, values in mapped_rows], config, import_context)
+
+            for index, row, values in mapped_rows:
+                try:
+                    product, rule_ids = resolved[IncomingProductInfo._get_product_key(values, import_context.rule_fields)]
+                    rule_hits.update((rule_id, values.get('sn')) for rule_id in rule_ids)
+
+                    if product == 'rule_without_product':
+                        result['rule_without_product'] += 1
+                        _logger.info(f"Rule found but no product assigned for row {index}")
+                        continue
+
+                    if product:
+                        values['product_id'] = product.id
+                        values['supplier_id'] = config.supplier_id.id
+                        if 'supplier_product_code' not in values:
+                            values['supplier_product_code'] = values.get('model_no', '')
+
+                        upsert_vals.append(values)
+                    else:
+                        unmatched_rows.append((index, row, values))
+
+                except psycopg2.OperationalError:
+                    raise
+                except Exception as e:
+                    result['errors'].append((index, row, str(e)))
+                    _logger.error(f"Error processing row {index}: {str(e)}", exc_info=True)
+
+            # Count the rule hits of the whole chunk at once
+            ImportCombinationRule._record_hits(rule_hits)
+
+        if unmatched_rows:
+            with telemetry.stage('unmatched', len(unmatched_rows)):
+                try:
+                    # Aggregate the unmatched rows of the chunk per model number and store them at once
+                    UnmatchedModelNo._add_rows([values for index, row, values in unmatched_rows], config)
+                    result['unmatched'] = len(unmatched_rows)
+                except psycopg2.OperationalError:
+                    raise
+                except Exception as e:
+                    result['errors'] += [(index, row, str(e)) for index, row, values in unmatched_rows]
+                    _logger.error(f"Error adding unmatched rows: {str(e)}", exc_info=True)
+
+        # Batch create and update, keyed on (supplier_id, sn)
+        if upsert_vals:
+            created_records, updated_count, skipped_count = IncomingProductInfo._upsert_rows(
+                config.supplier_id.id, upsert_vals, telemetry=telemetry)
+            result['created'] = len(created_records)
+            result['updated'] = updated_count
+            result['unchanged'] = skipped_count
+            _logger.info(f"Created {len(created_records)} new records, updated {updated_count} "
+                         f"and skipped {skipped_count} unchanged existing records in this batch")
+
+        return result
+
+    @api.model
+    def _drop_duplicate_rows(self, mapped_rows, config, import_context, result):
+        """
+        Collapse the rows of a chunk that repeat a serial number of an earlier
+        row of the file, following the duplicate policy of the config:
+
+        - first: rows repeating a serial number are dropped
+        - last: only the last row of a serial number is kept. Rows replaced by
+          a row of a later chunk are found by a first pass over the file and
+          left out by process_rows, this drops the repeats within the chunk
+        - error: rows repeating a serial number are dropped and reported
+
+        :param mapped_rows: A list of (row number, row, values) tuples
+        :param result: The counters of the chunk, updated in place
+        :return: The rows to import
+        """
+        duplicates = import_context.seen_sns.check_chunk(
+            [(index, values['sn']) for index, row, values in mapped_rows])
+        if not duplicates:
+            return mapped_rows
+
+        policy = config.duplicate_sn_policy or 'last'
+        if policy == 'last':
+            last_rows = {values['sn']: index for index, row, values in mapped_rows}
+            kept = [(index, row, values) for index, row, values in mapped_rows
+                    if last_rows[values['sn']] == index]
+        else:
+            if policy == 'error':
+                result['errors'] += [
+                    (index, row, f"Duplicate serial number {values['sn']}, first seen on row {duplicates[index]}")
+                    for index, row, values in mapped_rows if index in duplicates
+                ]
+            kept = [(index, row, values) for index, row, values in mapped_rows if index not in duplicates]
+        # Rows repeating an earlier chunk are still imported under 'last', only count the dropped ones
+        result['duplicates'] += len(mapped_rows) - len(kept)
+        return kept
+
+    @api.model
+    def _count_skipped_rows(self, rows, config, result):
+        """
+        Count the rows left out because another row of their serial number
+        wins as dropped duplicates, and report them under the 'error' policy.
+
+        :param rows: A list of (row number, row dictionary) tuples
+        :param result: The counters of the chunk, updated in place
+        """
+        result['duplicates'] += len(rows)
+        if config.duplicate_sn_policy == 'error':
+            result['errors'] += [(index, row, "Duplicate serial number of an earlier row") for index, row in rows]
+
+    @api.model
+    def _record_serial_numbers(self, chunk, chunk_start, first_row, import_context):
+        """
+        Add the serial numbers of a chunk that is not imported again to the
+        serial numbers seen by the import.
+        """
+        rows = []
+        for index, row in enumerate(chunk, start=chunk_start):
+            if index < first_row:
+                continue
+            try:
+                rows.append((index, import_context.mapping_plan.map_row(row)['sn']))
+            except Exception:
+                continue
+        import_context.seen_sns.check_chunk(rows)
@@ -1,6 +1,15 @@
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
 
+# Lot attributes filled from the incoming product info, when the lot has them
+LOT_INFO_FIELDS = {
+    'x_mac1': 'mac1',
+    'x_mac2': 'mac2',
+    'x_imei': 'imei',
+    'x_app_key': 'app_key',
+    'x_dev_eui': 'dev_eui',
+}
+
 class ReceiveProducts(models.TransientModel):
     _name = 'receive.products.wizard'
     _description = 'Receive Products Wizard'
@@ -11,6 +20,12 @@ class ReceiveProducts(models.TransientModel):
         ('manual', 'Manual')
     ], string='Lot Creation Method', default='auto', required=True)
     manual_lot_number = fields.Char(string='Manual Lot Number')
+    receipt_mode = fields.Selection([
+        ('batch', 'One Receipt'),
+        ('single', 'One Move per Product'),
+    ], string='Receipt Mode', default='batch', required=True,
+        help="One Receipt receives all selected products in a single validated receipt, "
+             "with one move per product. One Move per Product validates a separate move for each of them.")
 
     @api.onchange('lot_creation_method')
     def _onchange_lot_creation_method(self):
@@ -18,9 +33,12 @@ class ReceiveProducts(models.TransientModel):
             self.manual_lot_number = False
 
     def action_receive_products(self):
+        if self.receipt_mode == 'batch':
+            return self._receive_products_batched()
+
         StockMove = self.env['stock.move']
-        StockProductionLot = self.env['stock.production.lot']
-        
+        lot_by_info = self._get_lots(self.incoming_product_ids)
+
         for incoming_product in self.incoming_product_ids:
             move = StockMove.create({
                 'name': f"Receipt of {incoming_product.name}",
@@ -31,15 +49,8 @@ class ReceiveProducts(models.TransientModel):
                 'location_dest_id': self.env.ref('stock.stock_location_stock').id,
             })
             
-            lot_name = self._get_lot_name(incoming_product)
-            lot = StockProductionLot.create({
-                'name': lot_name,
-                'product_id': incoming_product.product_id.id,
-                'company_id': self.env.company.id,
-            })
-            
-            self._update_lot_info(lot, incoming_product)
-            
+            lot = lot_by_info[incoming_product.id]
+
             move._action_confirm()
             move._action_assign()
             move_line = move.move_line_ids[0]
@@ -56,11 +67,113 @@ class ReceiveProducts(models.TransientModel):
             return self.manual_lot_number
         return incoming_product.sn or incoming_product.model_no or f"LOT-{fields.Datetime.now().strftime('%Y%m%d%H%M%S')}"
 
+    def _get_lots(self, incoming_products):
+        """
+        Find or create the lots of incoming products at once, with their
+        attributes from the incoming product info. New lots are created with
+        them, existing lots are written once per set of identical values.
+
+        :return: A dict mapping incoming product ids to their lot
+        """
+        lot_names = {info.id: self._get_lot_name(info) for info in incoming_products}
+        lot_vals = {}
+        for info in incoming_products:
+            lot_vals.setdefault((lot_names[info.id], info.product_id.id), self._get_lot_info_values(info))
+        lots = self.env['incoming.product.info']._get_serial_number_lots(
+            [(lot_names[info.id], info.product_id) for info in incoming_products], lot_vals=lot_vals)
+
+        lot_by_info = {}
+        existing_by_vals = {}
+        for info in incoming_products:
+            key = (lot_names[info.id], info.product_id.id)
+            lot, state = lots[key]
+            lot_by_info[info.id] = lot
+            if state == 'received' and lot_vals[key]:
+                existing_by_vals.setdefault(tuple(sorted(lot_vals[key].items())), set()).add(lot.id)
+        StockLot = self.env['stock.lot']
+        for vals, lot_ids in existing_by_vals.items():
+            StockLot.browse(lot_ids).write(dict(vals))
+        return lot_by_info
+
     def _update_lot_info(self, lot, incoming_product):
-        lot.write({
-            'x_mac1': incoming_product.mac1,
-            'x_mac2': incoming_product.mac2,
-            'x_imei': incoming_product.imei,
-            'x_app_key': incoming_product.app_key,
-            'x_dev_eui': incoming_product.dev_eui,
-        })
\ No newline at end of file
+        lot.write(self._get_lot_info_values(incoming_product))
+
+    def _get_lot_info_values(self, incoming_product):
+        lot_fields = self.env['stock.lot']._fields
+        return {
+            lot_field: incoming_product[info_field]
+            for lot_field, info_field in LOT_INFO_FIELDS.items()
+            if lot_field in lot_fields
+        }
+
+    def _receive_products_batched(self):
+        """
+        Receive all selected products in one receipt: one move per product,
+        one move line per serial number, the lots found or created at once and
+        the receipt validated once.
+        """
+        self.ensure_one()
+        infos = self.incoming_product_ids.filtered('product_id')
+        if not infos:
+            raise UserError(_("None of the selected products is linked to a product variant."))
+
+        company = self.env.company
+        location = self.env.ref('stock.stock_location_suppliers')
+        location_dest = self.env.ref('stock.stock_location_stock')
+        picking_type = self.env['stock.picking.type'].search([
+            ('code', '=', 'incoming'),
+            ('company_id', '=', company.id),
+        ], limit=1)
+        if not picking_type:
+            raise UserError(_("No receipt operation type found for company %s.") % company.name)
+
+        lot_by_info = self._get_lots(infos)
+
+        infos_by_product = {}
+        for info in infos:
+            infos_by_product.setdefault(info.product_id, []).append(info)
+
+        suppliers = infos.supplier_id
+        picking = self.env['stock.picking'].create({
+            'picking_type_id': picking_type.id,
+            'partner_id': suppliers.id if len(suppliers) == 1 else False,
+            'location_id': location.id,
+            'location_dest_id': location_dest.id,
+            'origin': _("Incoming Product Info"),
+            'move_ids': [(0, 0, {
+                'name': _("Receipt of %s") % product.display_name,
+                'product_id': product.id,
+                'product_uom_qty': len(product_infos),
+                'product_uom': product.uom_id.id,
+                'location_id': location.id,
+                'location_dest_id': location_dest.id,
+                'company_id': company.id,
+            }) for product, product_infos in infos_by_product.items()],
+        })
+        picking.action_confirm()
+
+        move_by_product = {move.product_id.id: move for move in picking.move_ids}
+        self.env['stock.move.line'].create([{
+            'move_id': move_by_product[info.product_id.id].id,
+            'picking_id': picking.id,
+            'product_id': info.product_id.id,
+            'product_uom_id': info.product_id.uom_id.id,
+            'location_id': location.id,
+            'location_dest_id': location_dest.id,
+            'lot_id': lot_by_info[info.id].id,
+            'qty_done': 1,
+        } for info in infos])
+        picking._action_done()
+
+        infos.write({
+            'state': 'received',
+            'stock_picking_id': picking.id,
+        })
+
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': 'stock.picking',
+            'res_id': picking.id,
+            'view_mode': 'form',
+            'target': 'current',
+        }
\ No newline at end of file